@@ -1,5 +1,7 @@
 import streamlit as st
 
+from utils.store import restore_session
+
 # --- CONFIG ---
 
 st.set_page_config(page_title="ProjectDragon", layout="wide", page_icon='dragon')
@@ -11,6 +13,9 @@ hide_decoration_bar_style = '''
 '''
 st.markdown(hide_decoration_bar_style, unsafe_allow_html=True)
 
+# Merged data saved by an earlier session
+restore_session()
+
 # --- PAGE ---
 
 
@@ -31,7 +36,8 @@ with col1:
             Az adattal feltöltött táblák visszatöltését követően az adatok elemzése és vizualizálása a "Bevételek", "Kiadások" és "Összehasonlítások" menüpont alatt elérhető''')
     st.write('')
     st.write('''Az alkalmazásban való navigáláshoz a bal oldali, összecsukható sáv használandó. 
-            A program ideiglenes változókkal működik, semmilyen adat nem kerül mentésre! 
-            Az oldal frissítése után az ideiglenes változók elvesznek!''')
+            Az összefűzött bevételi és kiadási adatok, valamint a létszám adatok a szerveren mentésre kerülnek, 
+            az oldal frissítése vagy újraindítása után automatikusan visszatöltődnek. 
+            A feltöltött, még össze nem fűzött táblák továbbra is csak ideiglenesen élnek!''')
     st.write('')
     st.caption('A programot Simon Kristóf készítette.')
\ No newline at end of file
@@ -0,0 +1,140 @@
+# Compares the vectorized income_clean / expense_clean with the former per-cell implementation.
+# Usage: python benchmarks/clean_benchmark.py [rows]
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cleaning import income_clean, expense_clean
+from utils.dataset import DATE_PARTS
+
+# --- PREVIOUS IMPLEMENTATION ---
+
+def legacy_income_clean(df_inc_data, df_inc_cat):
+    df_income = pd.merge(df_inc_data, df_inc_cat, on='kat_kod', how='left')
+    df_income['year'] = pd.DatetimeIndex(df_income['datum']).year
+    df_income['month'] = pd.DatetimeIndex(df_income['datum']).month
+    df_income['quarter'] = pd.DatetimeIndex(df_income['datum']).quarter
+    df_income['month_year'] = df_income['datum'].dt.to_period('m')
+
+    for col in ['kat_kod', 'kategoria', 'alkategoria', 'elem']:
+        df_income[col] = df_income[col].apply(lambda x: str(x) if pd.notnull(x) else None)
+        df_income[col] = df_income[col].fillna('hiányos')
+
+    df_income = df_income.rename(columns={'teljes_forintban': 'netto'})
+    return df_income
+
+def legacy_expense_clean(df_exp_data, df_exp_cat):
+    df_expense = pd.merge(df_exp_data, df_exp_cat, on='kat_kod', how='left')
+    df_expense['year'] = pd.DatetimeIndex(df_expense['datum']).year
+    df_expense['month'] = pd.DatetimeIndex(df_expense['datum']).month
+    df_expense['quarter'] = pd.DatetimeIndex(df_expense['datum']).quarter
+    df_expense['month_year'] = df_expense['datum'].dt.to_period('m')
+
+    for col in ['bizonylat_szam', 'megjegyzes']:
+        df_expense[col] = df_expense[col].apply(lambda x: str(x) if pd.notnull(x) else None)
+        df_expense[col] = df_expense[col].fillna('')
+
+    df_expense['kat_kod'] = df_expense['kat_kod'].apply(lambda x: str(x) if pd.notnull(x) else None)
+    df_expense['kat_kod'] = df_expense['kat_kod'].fillna('hiányos')
+    df_expense['fo_kat'] = pd.to_numeric(df_expense['fo_kat'], errors='coerce').fillna(0).astype(int)
+    for col in ['kategoria', 'alkategoria', 'elem']:
+        df_expense[col] = df_expense[col].apply(lambda x: str(x) if pd.notnull(x) else None)
+        df_expense[col] = df_expense[col].fillna('hiányos')
+    return df_expense
+
+# --- SAMPLE DATA ---
+
+def sample_data(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    codes = np.array([f'K{i:03d}' for i in range(450)], dtype=object)
+    partners = np.array([f'Partner {i}' for i in range(2000)], dtype=object)
+    df_cat = pd.DataFrame({
+        'kategoria': [f'Kategória {i % 12}' for i in range(400)],
+        'alkategoria': [f'Alkategória {i % 60}' for i in range(400)],
+        'elem': [f'Elem {i}' for i in range(400)],
+        'kat_kod': codes[:400]})
+
+    datum = pd.Timestamp('2021-01-01') + pd.to_timedelta(rng.integers(0, 1460, rows), unit='D')
+    kat_kod = codes[rng.integers(0, len(codes), rows)]
+    partner = partners[rng.integers(0, len(partners), rows)]
+
+    df_inc_data = pd.DataFrame({
+        'partner': partner,
+        'datum': datum,
+        'egyseg_ar': rng.random(rows) * 1000,
+        'deviza': rng.choice(np.array(['HUF', 'EUR'], dtype=object), rows),
+        'mennyiseg': rng.integers(1, 100, rows),
+        'teljes_ar': rng.random(rows) * 10000,
+        'teljes_forintban': rng.random(rows) * 1000000,
+        'EUR_HUF': 390.0,
+        'kat_kod': kat_kod})
+
+    bizonylat = rng.integers(100000, 999999, rows).astype(object)
+    bizonylat[rng.random(rows) < 0.1] = None
+    megjegyzes = np.where(rng.random(rows) < 0.5, 'megjegyzés', None)
+    df_exp_data = pd.DataFrame({
+        'ID': np.arange(rows),
+        'partner': partner,
+        'bizonylat_szam': bizonylat,
+        'megjegyzes': megjegyzes,
+        'datum': datum,
+        'netto': rng.random(rows) * 1000000,
+        'kat_kod': kat_kod,
+        'fo_kat': rng.integers(0, 5, rows),
+        'forras': rng.choice(np.array(['bank', 'pénztár'], dtype=object), rows)})
+
+    return df_inc_data, df_exp_data, df_cat
+
+# --- NUMERIC CODES ---
+
+def check_numeric_codes():
+    # Integer kat_kod codes with empty cells are read as floats (101.0). They must find their category like in
+    # the old numeric merge, and be shown as 101 like in the category table.
+    df_inc_data, _, df_cat = sample_data(5000)
+    numbers = {code: float(100 + i) for i, code in enumerate(sorted(set(df_inc_data['kat_kod'])))}
+    df_inc_data['kat_kod'] = df_inc_data['kat_kod'].map(numbers)
+    df_inc_data.loc[df_inc_data.index[::50], 'kat_kod'] = np.nan
+    df_cat = df_cat.assign(kat_kod=df_cat['kat_kod'].map(numbers).astype(int))
+
+    expected = legacy_income_clean(df_inc_data.copy(), df_cat)
+    result = income_clean(df_inc_data.copy(), df_cat).resolve()
+    for col in ['kategoria', 'alkategoria', 'elem']:
+        assert (result[col].astype(object) == expected[col]).all(), col
+    assert (result['kat_kod'].astype(object) == expected['kat_kod'].str.removesuffix('.0')).all()
+    print(f'numeric kat_kod  {(expected["kategoria"] != "hiányos").sum():,} of {len(expected):,} rows matched (same as the numeric merge)')
+
+# --- BENCHMARK ---
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    check_numeric_codes()
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    df_inc_data, df_exp_data, df_cat = sample_data(rows)
+
+    for name, new, legacy, df_data in [
+        ('income_clean', income_clean, legacy_income_clean, df_inc_data),
+        ('expense_clean', expense_clean, legacy_expense_clean, df_exp_data),
+    ]:
+        expected, legacy_seconds = timed(legacy, df_data.copy(), df_cat)
+        dataset, new_seconds = timed(new, df_data.copy(), df_cat)
+        # The new output is a fact table plus category and calendar dimensions, its resolved view must match the old merge.
+        # Dimension columns are categorical now, their values must still be the same.
+        result = dataset.resolve(dates=DATE_PARTS, details=True).drop(columns='date_key')
+        categorical = [col for col in result.columns if isinstance(result[col].dtype, pd.CategoricalDtype)]
+        pd.testing.assert_frame_equal(result.astype({col: object for col in categorical}), expected)
+        legacy_mb = expected.memory_usage(deep=True).sum() / 1024 ** 2
+        new_mb = dataset.memory_usage() / 1024 ** 2
+        print(f'{name:<14} {rows:>10,} rows  previous: {legacy_seconds:7.2f} s {legacy_mb:8.1f} MB  '
+              f'vectorized: {new_seconds:7.2f} s {new_mb:8.1f} MB  speedup: {legacy_seconds / new_seconds:5.1f}x  (identical values)')
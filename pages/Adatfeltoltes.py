@@ -1,6 +1,13 @@
 import streamlit as st
 import pandas as pd
 
+from utils.cleaning import income_clean, expense_clean, prepare_exp_cat, prepare_exp_data, recategorize
+from utils.dataset import date_key
+from utils.loading import INC_DATA_SCHEMA, INC_CAT_SCHEMA, EXP_DATA_SCHEMA, EXP_CAT_SCHEMA, EMPLOYEES_SCHEMA, UPLOAD_TYPES, load_upload, release_parsed
+from utils.memory import SESSION_MEMORY_BUDGET, fits_budget, session_usage
+from utils.registry import drop_shared, get_registry, get_shared, put_shared, shared_key
+from utils.store import current_version, restore_session, save
+
 # --- CONFIG ---
 st.set_page_config(page_title="Adatfeltöltés", layout="wide", page_icon='dragon')
 
@@ -13,85 +20,92 @@ st.markdown(hide_decoration_bar_style, unsafe_allow_html=True)
 
 # --- SESSION VARIABLES ---
 
+# Merged data saved by an earlier session
+restore_session()
+
 if 'df_inc_data' not in st.session_state:
     df_inc_data = pd.DataFrame
 else:
-    df_inc_data = st.session_state['df_inc_data']
+    df_inc_data = get_shared('df_inc_data')
 
 if 'df_inc_cat' not in st.session_state:
     df_inc_cat = pd.DataFrame
 else:
-    df_inc_cat = st.session_state['df_inc_cat']
+    df_inc_cat = get_shared('df_inc_cat')
 
 if 'df_income' not in st.session_state:
     df_income = pd.DataFrame
 else:
-    df_income = st.session_state['df_income']
+    df_income = get_shared('df_income')
 
 if 'df_exp_data' not in st.session_state:
     df_exp_data = pd.DataFrame
 else:
-    df_exp_data = st.session_state['df_exp_data']
+    df_exp_data = get_shared('df_exp_data')
 
 if 'df_exp_cat' not in st.session_state:
     df_exp_cat = pd.DataFrame
 else:
-    df_exp_cat = st.session_state['df_exp_cat']
+    df_exp_cat = get_shared('df_exp_cat')
 
 if 'df_expense' not in st.session_state:
     df_expense = pd.DataFrame
 else:
-    df_expense = st.session_state['df_expense']
+    df_expense = get_shared('df_expense')
 
 if 'df_employees' not in st.session_state:
     df_employees = pd.DataFrame
 else:
-    df_employees = st.session_state['df_employees']
-
-# --- DATAFRAME CLEANING ---
-
-def income_clean(df_inc_data, df_inc_cat):
-    df_income = pd.merge(df_inc_data, df_inc_cat, on='kat_kod', how='left')
-    df_income['year'] = pd.DatetimeIndex(df_income['datum']).year
-    df_income['month'] = pd.DatetimeIndex(df_income['datum']).month
-    df_income['quarter'] = pd.DatetimeIndex(df_income['datum']).quarter
-    df_income['month_year'] = df_income['datum'].dt.to_period('m')
-    
-    df_income['kat_kod'] = df_income['kat_kod'].apply(lambda x: str(x) if pd.notnull(x) else None)
-    df_income['kat_kod'] = df_income['kat_kod'].fillna('hiányos')
-    df_income['kategoria'] = df_income['kategoria'].apply(lambda x: str(x) if pd.notnull(x) else None)
-    df_income['kategoria'] = df_income['kategoria'].fillna('hiányos')
-    df_income['alkategoria'] = df_income['alkategoria'].apply(lambda x: str(x) if pd.notnull(x) else None)
-    df_income['alkategoria'] = df_income['alkategoria'].fillna('hiányos')
-    df_income['elem'] = df_income['elem'].apply(lambda x: str(x) if pd.notnull(x) else None)
-    df_income['elem'] = df_income['elem'].fillna('hiányos')
-    
-    df_income = df_income.rename(columns={'teljes_forintban': 'netto'})
-    
-    return df_income
-
-def expense_clean(df_exp_data, df_exp_cat):
-    df_expense = pd.merge(df_exp_data, df_exp_cat, on='kat_kod', how='left')
-    df_expense['year'] = pd.DatetimeIndex(df_expense['datum']).year
-    df_expense['month'] = pd.DatetimeIndex(df_expense['datum']).month
-    df_expense['quarter'] = pd.DatetimeIndex(df_expense['datum']).quarter
-    df_expense['month_year'] = df_expense['datum'].dt.to_period('m')
-    
-    df_expense['bizonylat_szam'] = df_expense['bizonylat_szam'].apply(lambda x: str(x) if pd.notnull(x) else None)
-    df_expense['bizonylat_szam'] = df_expense['bizonylat_szam'].fillna('')
-    df_expense['megjegyzes'] = df_expense['megjegyzes'].apply(lambda x: str(x) if pd.notnull(x) else None)
-    df_expense['megjegyzes'] = df_expense['megjegyzes'].fillna('')
-    
-    df_expense['kat_kod'] = df_expense['kat_kod'].apply(lambda x: str(x) if pd.notnull(x) else None)
-    df_expense['kat_kod'] = df_expense['kat_kod'].fillna('hiányos')
-    df_expense['fo_kat'] = pd.to_numeric(df_expense['fo_kat'], errors='coerce').fillna(0).astype(int)
-    df_expense['kategoria'] = df_expense['kategoria'].apply(lambda x: str(x) if pd.notnull(x) else None)
-    df_expense['kategoria'] = df_expense['kategoria'].fillna('hiányos')
-    df_expense['alkategoria'] = df_expense['alkategoria'].apply(lambda x: str(x) if pd.notnull(x) else None)
-    df_expense['alkategoria'] = df_expense['alkategoria'].fillna('hiányos')
-    df_expense['elem'] = df_expense['elem'].apply(lambda x: str(x) if pd.notnull(x) else None)
-    df_expense['elem'] = df_expense['elem'].fillna('hiányos')
-    return df_expense
+    df_employees = get_shared('df_employees')
+
+# --- FUNCTIONS ---
+
+session_names = {
+    'df_inc_data': 'Bevételi adat',
+    'df_inc_cat': 'Bevételi kategória',
+    'df_income': 'Összefűzött bevételi adat',
+    'df_exp_data': 'Kiadási adat',
+    'df_exp_cat': 'Kiadási kategória',
+    'df_expense': 'Összefűzött kiadási adat',
+    'df_employees': 'Létszám adat'}
+
+budget_error = f'A fájl nem fér bele a munkamenet {SESSION_MEMORY_BUDGET / 1024 ** 2:,.0f} MB-os memóriakeretébe! Előbb fűzze össze a már feltöltött adatokat.'
+
+def parse_info(stats):
+    info = f"{stats['rows']:,} sor beolvasva {stats['seconds']:.2f} mp alatt ({stats['engine']} motor, {stats['rows_per_sec']:,.0f} sor/mp"
+    if 'peak_mb' in stats:
+        info += f", csúcs memória-növekedés: {stats['peak_mb']:,.1f} MB"
+    return info + ')'
+
+def prepare_employees(df):
+    df = df.copy()
+    df['date_key'] = date_key(df['datum'])
+    return df.drop(['datum'], axis=1)
+
+def usage_table():
+    usage = session_usage()
+    usage['name'] = usage['name'].map(lambda name: session_names.get(name, name))
+    usage['bytes'] = usage['bytes'].apply(lambda x: f"{x / 1024 ** 2:,.1f} MB")
+    return usage.rename(columns={'name': 'Adat', 'bytes': 'Memória', 'sessions': 'Megosztva (munkamenet)'}).set_index('Adat')
+
+def uploader_key(key):
+    # A released upload gets a new, empty uploader, so its file is not parsed again on the next rerun
+    return f"{key}_{st.session_state.get(f'uploader_{key}_round', 0)}"
+
+def release_raw(name, uploader):
+    # The raw rows go together with their parsed copy in the parse cache, unless another session still holds them
+    key = shared_key(name)
+    drop_shared(name)
+    if key not in get_registry():
+        release_parsed(key[1])
+    st.session_state[f'uploader_{uploader}_round'] = st.session_state.get(f'uploader_{uploader}_round', 0) + 1
+
+def stored_info(name):
+    # Versions are named after the save time: YYYYmmdd-HHMMSS-...
+    version = current_version(name)
+    if version is None:
+        return 'Nincs mentett verzió'
+    return f'Mentett verzió: {version[:4]}.{version[4:6]}.{version[6:8]} {version[9:11]}:{version[11:13]}:{version[13:15]}'
 
 # --- MAIN SITE ---
 
@@ -108,6 +122,7 @@ with info1:
     st.write('4. Az adat beolvasás az A:1 cellával kezdődik, így az adatnak is ott kell kezdődnie')
     st.write('5. A feltöltött excel táblák az első sorának egyeznie kell a mintában található oszlop nevekkel!')
     st.write('6. A szükséges excel táblák feltöltése és összefűzése után használható az alkalmazás.')
+    st.write('7. Excel helyett CSV (vesszővel vagy pontosvesszővel tagolt, UTF-8 kódolású) és Parquet fájl is feltölthető, azonos oszlopnevekkel.')
     
 with info2:
     #Income data
@@ -177,20 +192,27 @@ if df_income.empty:
         dcl1.warning('Bevételi adatok összefűzéséhez töltse fel a szükséges táblákat')
     else:
         if dcl1.button('Bevételi adatok összefűzése', use_container_width=True):
-            st.session_state['df_income'] = income_clean(df_inc_data, df_inc_cat)
+            income_key = ('df_income', shared_key('df_inc_data')[1], shared_key('df_inc_cat')[1])
+            save('df_income', put_shared('df_income', income_key, lambda: income_clean(df_inc_data, df_inc_cat)), income_key)
+            # The merged data replaces the raw rows, the small category table stays for a later re-merge
+            release_raw('df_inc_data', 1)
             st.rerun()
 else:
     dcl1.success('Bevételi adatok előkészítve')
+    dcl1.caption(stored_info('df_income'))
     
 if df_expense.empty:
     if df_exp_cat.empty or df_exp_data.empty:
         dcl2.warning('Kiadási adatok összefűzéséhez töltse fel a szükséges táblákat')
     else:
         if dcl2.button('Kiadási adatok összefűzése', use_container_width=True):
-            st.session_state['df_expense'] = expense_clean(df_exp_data, df_exp_cat)
+            expense_key = ('df_expense', shared_key('df_exp_data')[1], shared_key('df_exp_cat')[1])
+            save('df_expense', put_shared('df_expense', expense_key, lambda: expense_clean(df_exp_data, df_exp_cat)), expense_key)
+            release_raw('df_exp_data', 3)
             st.rerun()
 else:
     dcl2.success('Kiadási adatok előkészítve')
+    dcl2.caption(stored_info('df_expense'))
 
 
 # --- INCOME DATA ---
@@ -199,7 +221,9 @@ st.write('')
 st.subheader('Bevételi adatok', divider='grey')
 inc1, inc2 = st.columns((1,3), gap='medium')
 
-if df_inc_data.empty:
+if df_inc_data.empty and not df_income.empty:
+    inc1.success('Bevételi adat összefűzve')
+elif df_inc_data.empty:
     inc1.warning('Hiányzó bevételi adat')
 else:
     inc1.success('Bevételi adat feltöltve')
@@ -211,16 +235,22 @@ else:
 
 with inc2.expander('Bevételi adatok'):
 
-    inc_data = st.file_uploader('inc_data',type=['xlsx'], key=1, label_visibility='collapsed')
+    inc_data = st.file_uploader('inc_data',type=UPLOAD_TYPES, key=uploader_key(1), label_visibility='collapsed')
     
     if inc_data != None:
-        df_inc_data_columns = ['partner', 'datum', 'egyseg_ar', 'deviza', 'mennyiseg', 'teljes_ar', 'teljes_forintban', 'EUR_HUF', 'kat_kod']
-        temp_df_inc_data = pd.read_excel(inc_data)
-        if df_inc_data_columns == temp_df_inc_data.columns.to_list():
-            if st.button('Bevételi adatok mentése', use_container_width=True):
-                df_inc_data = temp_df_inc_data
+        df_inc_data_columns = INC_DATA_SCHEMA
+        inc_data_progress = st.empty()
+        temp_df_inc_data, inc_data_stats = load_upload(inc_data, df_inc_data_columns, progress=lambda x: inc_data_progress.progress(x, text='Beolvasás...'))
+        inc_data_progress.empty()
+        if temp_df_inc_data is not None:
+            st.caption(parse_info(inc_data_stats))
+            if not fits_budget(temp_df_inc_data, replaces='df_inc_data', nbytes=inc_data_stats.get('nbytes')):
+                st.error(budget_error)
+            elif st.button('Bevételi adatok mentése', use_container_width=True):
+                put_shared('df_inc_data', ('df_inc_data', inc_data_stats['content_hash']), lambda: temp_df_inc_data)
                 del temp_df_inc_data
-                st.session_state['df_inc_data'] = df_inc_data
+                # New rows have to be merged again
+                drop_shared('df_income')
                 st.rerun()
         else:
             st.error('Helytelen oszlopnevek!')
@@ -230,16 +260,24 @@ with inc2.expander('Bevételi adatok'):
 
 with inc2.expander('Bevételi kategóriák'):
 
-    inc_cat = st.file_uploader('inc_cat',type=['xlsx'], key=2, label_visibility='collapsed')
+    inc_cat = st.file_uploader('inc_cat',type=UPLOAD_TYPES, key=2, label_visibility='collapsed')
     
     if inc_cat != None:
-        df_inc_cat_columns = ['kategoria', 'alkategoria', 'elem', 'kat_kod']
-        temp_df_inc_cat = pd.read_excel(inc_cat)
-        if df_inc_cat_columns == temp_df_inc_cat.columns.to_list():
+        df_inc_cat_columns = INC_CAT_SCHEMA
+        inc_cat_progress = st.empty()
+        temp_df_inc_cat, inc_cat_stats = load_upload(inc_cat, df_inc_cat_columns, progress=lambda x: inc_cat_progress.progress(x, text='Beolvasás...'))
+        inc_cat_progress.empty()
+        if temp_df_inc_cat is not None:
+            st.caption(parse_info(inc_cat_stats))
+            if not df_income.empty:
+                st.caption('Mentéskor az összefűzött bevételi adatok azonnal az új kategóriák szerint jelennek meg, újra összefűzés nélkül.')
             if st.button('Bevételi kategóriák mentése', use_container_width=True):
-                df_inc_cat = temp_df_inc_cat
+                df_inc_cat = put_shared('df_inc_cat', ('df_inc_cat', inc_cat_stats['content_hash']), lambda: temp_df_inc_cat)
                 del temp_df_inc_cat
-                st.session_state['df_inc_cat'] = df_inc_cat
+                # Already merged data only gets the new category dimension
+                if not df_income.empty:
+                    income_key = ('df_income', shared_key('df_income')[1], shared_key('df_inc_cat')[1])
+                    save('df_income', put_shared('df_income', income_key, lambda: recategorize(df_income, df_inc_cat)), income_key)
                 st.rerun()
         else:
             st.error('Helytelen oszlopnevek!')
@@ -253,7 +291,9 @@ st.write('')
 st.subheader('Kiadási adatok', divider='grey')
 exp1, exp2 = st.columns((1,3), gap='medium')
 
-if df_exp_data.empty:
+if df_exp_data.empty and not df_expense.empty:
+    exp1.success('Kiadási adat összefűzve')
+elif df_exp_data.empty:
     exp1.warning('Hiányzó kiadási adat')
 else:
     exp1.success('Kiadási adat feltöltve')
@@ -265,21 +305,21 @@ else:
 
 with exp2.expander('Kiadási adatok'):
 
-    exp_data = st.file_uploader('exp_data',type=['xlsx'], key=3, label_visibility='collapsed')
+    exp_data = st.file_uploader('exp_data',type=UPLOAD_TYPES, key=uploader_key(3), label_visibility='collapsed')
     
     if exp_data != None:
-        df_exp_data_columns = ['ID', 'partner', 'bizonylat_szam', 'megjegyzes', 'datum', 'netto', 'kat_kod', 'fo_kat', 'forras']
-        temp_df_exp_data = pd.read_excel(exp_data)
-        if df_exp_data_columns == temp_df_exp_data.columns.to_list():
-            if st.button('Kiadási adatok mentése', use_container_width=True):
-                df_exp_data = temp_df_exp_data
-                df_exp_data['bizonylat_szam'] = df_exp_data['bizonylat_szam'].apply(lambda x: str(x) if pd.notnull(x) else None)
-                df_exp_data['bizonylat_szam'] = df_exp_data['bizonylat_szam'].fillna('')
-                df_exp_data['megjegyzes'] = df_exp_data['megjegyzes'].apply(lambda x: str(x) if pd.notnull(x) else None)
-                df_exp_data['megjegyzes'] = df_exp_data['megjegyzes'].fillna('')
-                df_exp_data['kat_kod'] = df_exp_data['kat_kod'].str.strip()
+        df_exp_data_columns = EXP_DATA_SCHEMA
+        exp_data_progress = st.empty()
+        temp_df_exp_data, exp_data_stats = load_upload(exp_data, df_exp_data_columns, progress=lambda x: exp_data_progress.progress(x, text='Beolvasás...'))
+        exp_data_progress.empty()
+        if temp_df_exp_data is not None:
+            st.caption(parse_info(exp_data_stats))
+            if not fits_budget(temp_df_exp_data, replaces='df_exp_data', nbytes=exp_data_stats.get('nbytes')):
+                st.error(budget_error)
+            elif st.button('Kiadási adatok mentése', use_container_width=True):
+                put_shared('df_exp_data', ('df_exp_data', exp_data_stats['content_hash']), lambda: prepare_exp_data(temp_df_exp_data))
                 del temp_df_exp_data
-                st.session_state['df_exp_data'] = df_exp_data
+                drop_shared('df_expense')
                 st.rerun()
         else:
             st.error('Helytelen oszlopnevek!')
@@ -289,17 +329,24 @@ with exp2.expander('Kiadási adatok'):
 
 with exp2.expander('Kiadási kategóriák'):
 
-    exp_cat = st.file_uploader('exp_cat',type=['xlsx'], key=4, label_visibility='collapsed')
+    exp_cat = st.file_uploader('exp_cat',type=UPLOAD_TYPES, key=4, label_visibility='collapsed')
     
     if exp_cat != None:
-        df_exp_cat_columns = ['kategoria', 'alkategoria', 'elem', 'kat_kod']
-        temp_df_exp_cat = pd.read_excel(exp_cat)
-        if df_exp_cat_columns == temp_df_exp_cat.columns.to_list():
+        df_exp_cat_columns = EXP_CAT_SCHEMA
+        exp_cat_progress = st.empty()
+        temp_df_exp_cat, exp_cat_stats = load_upload(exp_cat, df_exp_cat_columns, progress=lambda x: exp_cat_progress.progress(x, text='Beolvasás...'))
+        exp_cat_progress.empty()
+        if temp_df_exp_cat is not None:
+            st.caption(parse_info(exp_cat_stats))
+            if not df_expense.empty:
+                st.caption('Mentéskor az összefűzött kiadási adatok azonnal az új kategóriák szerint jelennek meg, újra összefűzés nélkül.')
             if st.button('Kiadási kategóriák mentése', use_container_width=True):
-                df_exp_cat = temp_df_exp_cat
-                df_exp_cat['kat_kod'] = df_exp_cat['kat_kod'].str.strip()
+                df_exp_cat = put_shared('df_exp_cat', ('df_exp_cat', exp_cat_stats['content_hash']), lambda: prepare_exp_cat(temp_df_exp_cat))
                 del temp_df_exp_cat
-                st.session_state['df_exp_cat'] = df_exp_cat
+                # Already merged data only gets the new category dimension
+                if not df_expense.empty:
+                    expense_key = ('df_expense', shared_key('df_expense')[1], shared_key('df_exp_cat')[1])
+                    save('df_expense', put_shared('df_expense', expense_key, lambda: recategorize(df_expense, df_exp_cat)), expense_key)
                 st.rerun()
         else:
             st.error('Helytelen oszlopnevek!')
@@ -317,26 +364,37 @@ if df_employees.empty:
     emp1.warning('Hiányzó létszám adat')
 else:
     emp1.success('Létszám adatok feltöltve')
+    emp1.caption(stored_info('df_employees'))
 
 with emp2.expander('Létszám adatok'):
 
-    employees = st.file_uploader('employee',type=['xlsx'], key=5, label_visibility='collapsed')
+    employees = st.file_uploader('employee',type=UPLOAD_TYPES, key=5, label_visibility='collapsed')
     
     if employees != None:
-        df_employees_columns = ['datum', 'vam', 'penzugy', 'egyeb', 'osszes']
-        temp_df_employees = pd.read_excel(employees)
-        if df_employees_columns == temp_df_employees.columns.to_list():
+        df_employees_columns = EMPLOYEES_SCHEMA
+        employees_progress = st.empty()
+        temp_df_employees, employees_stats = load_upload(employees, df_employees_columns, progress=lambda x: employees_progress.progress(x, text='Beolvasás...'))
+        employees_progress.empty()
+        if temp_df_employees is not None:
+            st.caption(parse_info(employees_stats))
             if st.button('Létszám adatok mentése', use_container_width=True):
-                df_employees = temp_df_employees
+                employees_key = ('df_employees', employees_stats['content_hash'])
+                save('df_employees', put_shared('df_employees', employees_key, lambda: prepare_employees(temp_df_employees)), employees_key)
                 del temp_df_employees
-                df_employees['month_year'] = df_employees['datum'].dt.to_period('m')
-                df_employees['year'] = pd.DatetimeIndex(df_employees['datum']).year
-                df_employees['quarter'] = pd.DatetimeIndex(df_employees['datum']).quarter
-                df_employees = df_employees.drop(['datum'], axis=1)
-                st.session_state['df_employees'] = df_employees
                 st.rerun()
         else:
             st.error('Helytelen oszlopnevek!')
     if not df_employees.empty:
         st.subheader('Aktív létszám adatok', divider='grey')
-        st.dataframe(df_employees)
\ No newline at end of file
+        st.dataframe(df_employees)
+
+# --- SESSION MEMORY ---
+
+st.write('')
+st.subheader('Munkamenet memória', divider='grey')
+mem1, mem2 = st.columns((1,3), gap='medium')
+
+held = session_usage()['bytes'].sum()
+mem1.progress(min(held / SESSION_MEMORY_BUDGET, 1.0), text=f'{held / 1024 ** 2:,.1f} MB / {SESSION_MEMORY_BUDGET / 1024 ** 2:,.0f} MB')
+mem1.caption('Az összefűzés után a nyers adattáblák felszabadulnak. A több munkamenetben azonos adat csak egyszer foglal memóriát.')
+mem2.dataframe(usage_table(), use_container_width=True)
@@ -7,6 +7,13 @@ from plotly.subplots import make_subplots
 import calendar
 import locale
 
+from utils.analytics import TOTALS, aggregate, grouping_sets
+from utils.dataset import with_calendar
+from utils.filtering import FilterSpec, filter_options, select, show_plan, staged_filter_panel
+from utils.registry import get_shared
+from utils.store import restore_session
+from utils.tabs import lazy_tabs
+
 # --- CONFIG ---
 
 st.set_page_config(page_title="Bevételek", layout="wide", page_icon='dragon')
@@ -260,7 +267,7 @@ def plot_treemap(df):
 
     st.plotly_chart(fig, use_container_width=True)
     
-def comparison(df, type, years, comp_cats, comp_subcats, comp_items):
+def comparison(dataset, spec, type, years, comp_cats, comp_subcats, comp_items):
     
     fig1 = make_subplots(
         rows=1, cols=1,
@@ -290,8 +297,8 @@ def comparison(df, type, years, comp_cats, comp_subcats, comp_items):
         return hungarian_quarters[quarter_number - 1]
 
     if type == 'Kategória':
-        monthly_data = df.groupby(['year', 'month', 'kategoria'])['netto'].sum().reset_index()
-        quarterly_data = df.groupby(['year', 'quarter', 'kategoria'])['netto'].sum().reset_index()
+        monthly_data = aggregate(dataset, spec, ['year', 'month', 'kategoria'])
+        quarterly_data = aggregate(dataset, spec, ['year', 'quarter', 'kategoria'])
         
         for category in comp_cats:
             for year in years:
@@ -337,8 +344,8 @@ def comparison(df, type, years, comp_cats, comp_subcats, comp_items):
         
     elif type == 'Alkategória':
         
-        monthly_data = df.groupby(['year', 'month', 'alkategoria'])['netto'].sum().reset_index()
-        quarterly_data = df.groupby(['year', 'quarter', 'alkategoria'])['netto'].sum().reset_index()
+        monthly_data = aggregate(dataset, spec, ['year', 'month', 'alkategoria'])
+        quarterly_data = aggregate(dataset, spec, ['year', 'quarter', 'alkategoria'])
         
         for category in comp_subcats:
             for year in years:
@@ -384,8 +391,8 @@ def comparison(df, type, years, comp_cats, comp_subcats, comp_items):
 
     elif type == 'Elem':
         
-        monthly_data = df.groupby(['year', 'month', 'elem'])['netto'].sum().reset_index()
-        quarterly_data = df.groupby(['year', 'quarter', 'elem'])['netto'].sum().reset_index()
+        monthly_data = aggregate(dataset, spec, ['year', 'month', 'elem'])
+        quarterly_data = aggregate(dataset, spec, ['year', 'quarter', 'elem'])
         
         for category in comp_items:
             for year in years:
@@ -451,6 +458,12 @@ def comparison(df, type, years, comp_cats, comp_subcats, comp_items):
     st.plotly_chart(fig1)
     st.plotly_chart(fig2)
       
+def summary_table(df):
+    # Display copy of a grouping_sets table: amounts and shares rounded and formatted
+    return pd.DataFrame({
+        'Nettó': df['netto'].round(0).map(lambda x: f"{int(x):,} Ft"),
+        'Százalék': df['percentage'].round(2).map(lambda x: f"{x:.2f}%")})
+
 def table_formating():
     st.markdown(
                     """
@@ -469,6 +482,244 @@ def table_formating():
                     unsafe_allow_html=True
                 )
 
+@st.fragment
+def sunburst_panel(dataset, spec):
+    # Sunburst of the filtered totals of the path; its level selectboxes only rerun this chart
+    sun_data_type = st.selectbox('Kategória vagy pertner alapú csoportosítás', options=['Kategória','Partner'])
+
+    if sun_data_type == 'Kategória':
+        path = ['kategoria', 'alkategoria', 'elem']
+        sunburst(aggregate(dataset, spec, path), path)
+
+    elif sun_data_type == 'Partner':
+        sun_data_lvl = st.selectbox('Legkisebb szint', options=['Partner','Kategória','Alkategória','Elem'])
+
+        if sun_data_lvl == 'Partner':
+            path = ['partner']
+
+        if sun_data_lvl == 'Kategória':
+            path = ['partner','kategoria']
+
+        if sun_data_lvl == 'Alkategória':
+            path = ['partner','kategoria', 'alkategoria']
+
+        if sun_data_lvl == 'Elem':
+            path = ['partner','kategoria', 'alkategoria', 'elem']
+
+        sunburst(aggregate(dataset, spec, path), path)
+
+
+@st.fragment
+def summary_panel(summary):
+    # Summary table of the level picked here, reruns on its own
+    sun_data = st.selectbox('Vizsgált szint', options=['Partner','Kategória','Alkategória','Elem'])
+
+    if sun_data == 'Partner':
+        st.write('')
+        st.table(summary_table(summary['partner']))
+        table_formating()
+
+    if sun_data == 'Kategória':
+        st.write('')
+        st.table(summary_table(summary['kategoria']))
+        table_formating()
+
+    if sun_data == 'Alkategória':
+        st.write('')
+        st.table(summary_table(summary['alkategoria']))
+        table_formating()
+
+    if sun_data == 'Elem':
+        st.write('')
+        st.table(summary_table(summary['elem']))
+        table_formating()
+
+
+@st.fragment
+def sunburst_comparison_panel(dataset, spec):
+    # Sunburst of two years side by side with the yearly change; the year and level pickers only rerun this panel
+    suncomp1, suncomp2 , suncomp3= st.columns((4,2,4))
+
+    sun_type = suncomp2.selectbox('Összehasonlítás', options=['Partner','Kategória','Alkategória','Elem'], help='Alkategória és elem összehasonlításnál érdemes az adatokat előre szűrni, hogy könnyebben áttekinthető legyen a változás!')
+
+    if sun_type == 'Partner':
+        path = ['partner']
+
+    if sun_type == 'Kategória':
+        path = ['kategoria']
+
+    if sun_type == 'Alkategória':
+        path = ['alkategoria']
+
+    if sun_type == 'Elem':
+        path = ['elem']
+
+    # Yearly totals of the level, both sunbursts and the changes are read from them
+    yearly = aggregate(dataset, spec, ['year'] + path)
+
+    with suncomp1:
+        sun_year1 = st.selectbox('Hasonlítási év', options=filter_options(dataset, 'year'), placeholder='Válassz évet')
+        df_sun_year1 = yearly[yearly['year'] == sun_year1]
+
+        sunburst(df_sun_year1, path)                    
+
+    with suncomp3:
+        sun_year2 = st.selectbox('Vizsgált év', options=filter_options(dataset, 'year'), placeholder='Válassz évet')
+        df_sun_year2 = yearly[yearly['year'] == sun_year2]
+
+        sunburst(df_sun_year2, path)   
+
+    with suncomp2:
+
+        if sun_type == 'Partner':
+            df_sun1 = df_sun_year1.set_index('partner')[['netto']]
+            df_sun2 = df_sun_year2.set_index('partner')[['netto']]
+            df_sun_merge = pd.merge(left=df_sun1,right=df_sun2,on='partner',how='right')
+            df_sun_merge['diff'] = (df_sun_merge['netto_y']/df_sun_merge['netto_x'])*100-100
+            df_sun_merge['diff'] = df_sun_merge['diff'].round(2)
+            df_sun_merge['netto_y'] = df_sun_merge['netto_y'].round()
+            df_sun_merge = df_sun_merge.sort_values(['netto_y'], ascending=False)
+            for key, values in df_sun_merge.iterrows():
+                netto_y_formatted = f"{values['netto_y']:,.0f} Ft"
+                diff_formated  = f"{values['diff']:,.2f} %"
+                st.metric(f'{key}',value=netto_y_formatted ,delta=diff_formated)
+
+        if sun_type == 'Kategória':
+            df_sun1 = df_sun_year1.set_index('kategoria')[['netto']]
+            df_sun2 = df_sun_year2.set_index('kategoria')[['netto']]
+            df_sun_merge = pd.merge(left=df_sun1,right=df_sun2,on='kategoria',how='right')
+            df_sun_merge['diff'] = (df_sun_merge['netto_y']/df_sun_merge['netto_x'])*100-100
+            df_sun_merge['diff'] = df_sun_merge['diff'].round(2)
+            df_sun_merge['netto_y'] = df_sun_merge['netto_y'].round()
+            df_sun_merge = df_sun_merge.sort_values(['netto_y'], ascending=False)
+            for key, values in df_sun_merge.iterrows():
+                netto_y_formatted = f"{values['netto_y']:,.0f} Ft"
+                diff_formated  = f"{values['diff']:,.2f} %"
+                st.metric(f'{key}',value=netto_y_formatted ,delta=diff_formated)
+
+        if sun_type == 'Alkategória':
+            df_sun1 = df_sun_year1.set_index('alkategoria')[['netto']]
+            df_sun2 = df_sun_year2.set_index('alkategoria')[['netto']]
+            df_sun_merge = pd.merge(left=df_sun1,right=df_sun2,on='alkategoria',how='right')
+            df_sun_merge['diff'] = (df_sun_merge['netto_y']/df_sun_merge['netto_x'])*100-100
+            df_sun_merge['diff'] = df_sun_merge['diff'].round(2)
+            df_sun_merge['netto_y'] = df_sun_merge['netto_y'].round()
+            df_sun_merge = df_sun_merge.sort_values(['netto_y'], ascending=False)
+            for key, values in df_sun_merge.iterrows():
+                netto_y_formatted = f"{values['netto_y']:,.0f} Ft"
+                diff_formated  = f"{values['diff']:,.2f} %"
+                st.metric(f'{key}',value=netto_y_formatted ,delta=diff_formated)
+
+        if sun_type == 'Elem':
+            df_sun1 = df_sun_year1.set_index('elem')[['netto']]
+            df_sun2 = df_sun_year2.set_index('elem')[['netto']]
+            df_sun_merge = pd.merge(left=df_sun1,right=df_sun2,on='elem',how='right')
+            df_sun_merge['diff'] = (df_sun_merge['netto_y']/df_sun_merge['netto_x'])*100-100
+            df_sun_merge['diff'] = df_sun_merge['diff'].round(2)
+            df_sun_merge['netto_y'] = df_sun_merge['netto_y'].round()
+            df_sun_merge = df_sun_merge.sort_values(['netto_y'], ascending=False)
+            for key, values in df_sun_merge.iterrows():
+                netto_y_formatted = f"{values['netto_y']:,.0f} Ft"
+                diff_formated  = f"{values['diff']:,.2f} %"
+                st.metric(f'{key}',value=netto_y_formatted ,delta=diff_formated)
+
+
+@st.fragment
+def comparison_panel(dataset):
+    # Monthly / quarterly comparison with its own filters, independent of the page filters
+    comp_col1, comp_col2 = st.columns((1,4))
+    comp_type = comp_col1.selectbox('Összehasonlítási szint', options=['Kategória','Alkategória','Elem'])
+
+    comp_years = dataset.distinct('year')
+    comp_cats = dataset.distinct('kategoria')
+    comp_subcats = dataset.distinct('alkategoria')
+    comp_items = dataset.distinct('elem')
+
+    if comp_type == 'Kategória':
+
+        with comp_col2:
+            subcomp1, subcomp2 = st.columns((1,2))
+
+            comp_year = dataset.distinct('year')
+            comp_years = subcomp1.multiselect('Összehasonlított évek', options=comp_year, placeholder='Válassz évet')
+            if len(comp_years) == 0:
+                comp_years = dataset.distinct('year')
+
+            comp_cat = dataset.distinct('kategoria')
+            comp_cats = subcomp2.multiselect('Összehasonlított kategóriák', options=comp_cat, placeholder='Válassz kategóriát')
+            if len(comp_cats) == 0:
+                comp_cats = dataset.distinct('kategoria')
+
+            comp_spec = FilterSpec({'year': comp_years, 'kategoria': comp_cats})
+
+    elif comp_type == 'Alkategória':
+
+        with comp_col1:
+            comp_year = dataset.distinct('year')
+            comp_years = st.multiselect('Összehasonlított évek', options=comp_year, placeholder='Válassz évet')
+            if len(comp_years) == 0:
+                comp_years = dataset.distinct('year')
+
+        with comp_col2:
+            subcomp1, subcomp2 = st.columns((1,2))
+
+            comp_cat = dataset.distinct('kategoria')
+            comp_cats = subcomp1.multiselect('Összehasonlított kategóriák', options=comp_cat, placeholder='Válassz kategóriát')
+            if len(comp_cats) == 0:
+                comp_cats = dataset.distinct('kategoria')
+
+            comp_subcat = dataset.children('alkategoria', comp_cats)
+            comp_subcats = subcomp2.multiselect('Összehasonlított alkategóriák', options=comp_subcat, placeholder='Válassz alkategóriát')
+            if len(comp_subcats) == 0:
+                comp_subcats = dataset.distinct('alkategoria')
+
+        comp_spec = FilterSpec({'year': comp_years, 'kategoria': comp_cats, 'alkategoria': comp_subcats})
+
+    elif comp_type == 'Elem':
+
+        with comp_col1:
+            comp_year = dataset.distinct('year')
+            comp_years = st.multiselect('Összehasonlított évek', options=comp_year, placeholder='Válassz évet')
+            if len(comp_years) == 0:
+                comp_years = dataset.distinct('year')
+
+        with comp_col2:
+            subcomp1, subcomp2 = st.columns((1,2))
+
+            comp_cat = dataset.distinct('kategoria')
+            comp_cats = subcomp1.multiselect('Összehasonlított kategóriák', options=comp_cat, placeholder='Válassz kategóriát')
+            if len(comp_cats) == 0:
+                comp_cats = dataset.distinct('kategoria')
+
+            comp_subcat = dataset.children('alkategoria', comp_cats)
+            comp_subcats = subcomp2.multiselect('Összehasonlított alkategóriák', options=comp_subcat, placeholder='Válassz alkategóriát')
+            if len(comp_subcats) == 0:
+                comp_subcats = dataset.distinct('alkategoria')
+
+            comp_item = dataset.children('elem', comp_subcats)
+            comp_items = st.multiselect('Összehasonlított elemek', options=comp_item, placeholder='Válassz elemet')
+            if len(comp_items) == 0:
+                comp_items = dataset.distinct('elem')                    
+
+        comp_spec = FilterSpec({'year': comp_years, 'kategoria': comp_cats, 'alkategoria': comp_subcats, 'elem': comp_items})                         
+
+    comparison(dataset, comp_spec, comp_type, comp_years, comp_cats, comp_subcats, comp_items)
+
+def filter_layout():
+    with st.expander('Keresés és szűrés'):
+        st.markdown('**A szűrési feltételek kiválaszhatók a legürgülő listából, de a mezőbe kattintva be lehet írni a keresett elemet, majd arra rákattintva kiválasztani.**')
+        yfcol1, yfcol2, yfcol3 = st.columns((1,1,1), gap='medium')
+        cfcol1, cfcol2, cfcol3 = st.columns((1,1,1), gap='medium')
+        cfcol4, cfcol5, cfcol6 = st.columns((3,1,1), gap='medium')
+        afcol = st.container()
+
+    return {
+        'year': yfcol1, 'quarter': yfcol2, 'month': yfcol3,
+        'kategoria': cfcol1, 'alkategoria': cfcol2, 'elem': cfcol3,
+        'kat_kod': cfcol5, 'partner': cfcol4, 'mode': cfcol6, 'apply': afcol}
+
+
+
 # --- PAGE ---
 
 st.title('Bevételek')
@@ -476,6 +727,9 @@ st.divider()
 
 # --- SESSION VARIABLES ---
 
+# Merged data saved by an earlier session
+restore_session()
+
 if 'df_income' not in st.session_state:
     st.subheader('Nincs feltöltve vizsgálandó adat.')
     st.write('')
@@ -483,153 +737,45 @@ if 'df_income' not in st.session_state:
     st.write('')
     st.page_link('pages/Adatfeltoltes.py', label=' Adatfeltöltés', icon='📝')
 else:
-    df = st.session_state['df_income']
-    
-    # --- FILTERING ---
-    with st.expander('Keresés és szűrés'):
-        st.markdown('**A szűrési feltételek kiválaszhatók a legürgülő listából, de a mezőbe kattintva be lehet írni a keresett elemet, majd arra rákattintva kiválasztani.**')
-        yfcol1, yfcol2, yfcol3 = st.columns((1,1,1), gap='medium')
-        cfcol1, cfcol2, cfcol3 = st.columns((1,1,1), gap='medium')
-        cfcol4, cfcol5, cfcol6 = st.columns((3,1,1), gap='medium')
-    
-# --- TIME FILTERS ---
-
-    quarter_mapping = {'Q1': 1, 'Q2': 2, 'Q3': 3, 'Q4': 4}
-    months_in_quarter = {
-        1: [1, 2, 3],
-        2: [4, 5, 6],
-        3: [7, 8, 9],
-        4: [10, 11, 12]}
-    month_names = { 1: 'Január', 2: 'Február', 3: 'Március', 4: 'Április', 5: 'Május', 6: 'Június', 7: 'Július', 8: 'Augusztus', 9: 'Szeptember', 10: 'Október', 11: 'November', 12: 'December'}
-    year = sorted(df['year'].unique())
-    years = yfcol1.multiselect('Tárgyév', options=year, placeholder='Válassz évet',)
-    if len(years) == 0:
-        years = sorted(df['year'].unique())
-
-    quarters = yfcol2.multiselect('Negyedév', options=quarter_mapping, placeholder='Válassz negyedévet')
-    selected_quarters = [quarter_mapping[q] for q in quarters]
-    if len(selected_quarters) == 0:
-        selected_quarters = sorted(df['quarter'].unique())
-    
-    available_months = set()
-    for q in selected_quarters:
-        available_months.update(months_in_quarter[q])
-        
-    available_month_names = [month_names[m] for m in available_months]
-    
-    months = yfcol3.multiselect('Hónap', options=available_month_names, placeholder='Válassz hónapot')
-    selected_months = [k for k, v in month_names.items() if v in months]
-    if len(selected_months) == 0:
-        selected_months = sorted(df['month'].unique())
-
-# --- CATEGORY FILTERS ---
-
-    kategoria = sorted(df['kategoria'].unique())
-    kategoriak = cfcol1.multiselect('Kategória', options=kategoria, placeholder='Válassz kategóriát')
-    if len(kategoriak) == 0:
-        kategoriak = sorted(df['kategoria'].unique())
-
-    alkategoria = sorted(df.loc[df['kategoria'].isin(kategoriak), 'alkategoria'].unique())
-    alkategoriak = cfcol2.multiselect('Alkategória', options=alkategoria, placeholder='Válassz alkategóriát')
-    if len(alkategoriak) == 0:
-        alkategoriak = sorted(df['alkategoria'].unique())
-        
-    elem = sorted(df.loc[df['alkategoria'].isin(alkategoriak), 'elem'].unique())
-    elemek = cfcol3.multiselect('Kategória elem', options=elem, placeholder='Válassz kategória elemet')
-    if len(elemek) == 0:
-        elemek = sorted(df['elem'].unique())
+    dataset = get_shared('df_income')
     
-    kat_kod = sorted(df['kat_kod'].unique())
-    kat_kodok = cfcol5.multiselect('Kategória kód', options=kat_kod, placeholder='Válassz kategória kódot')
-    if len(kat_kodok) == 0:
-        kat_kodok = sorted(df['kat_kod'].unique())
+# --- FILTERS ---
 
-    partner = sorted(df['partner'].unique())
-    partnerek = cfcol4.multiselect('Partner', options=partner, placeholder='Válassz partnert')
-    if len(partnerek) == 0:
-        partnerek = sorted(df['partner'].unique())
+    spec = staged_filter_panel(dataset, filter_layout, key='income_filters')
+    show_plan(dataset, spec)
+    totals = aggregate(dataset, spec, values=TOTALS).iloc[0]
 
-    in_or_not = cfcol6.selectbox('Szűrés típusa', options=['Tartalmazza','Kivéve'], help='Kivéve esetén ha nincs megadott feltétel, akkor nem jelenik meg adat! Először adja meg a kivételt, utána álltsa a mezőt Kivéve értékre!')
-    
-    if in_or_not == 'Tartalmazza':
-        selected_df = df[
-            (df['year'].isin(years)) &
-            (df['quarter'].isin(selected_quarters)) &
-            (df['month'].isin(selected_months)) &
-            (df['kat_kod'].isin(kat_kodok)) &
-            (df['kategoria'].isin(kategoriak)) &
-            (df['alkategoria'].isin(alkategoriak)) &
-            (df['elem'].isin(elemek)) &
-            (df['partner'].isin(partnerek))]
-    elif in_or_not == 'Kivéve':
-       selected_df = df[
-            (~df['year'].isin(years)) |
-            (~df['quarter'].isin(selected_quarters)) |
-            (~df['month'].isin(selected_months)) |
-            (~df['kat_kod'].isin(kat_kodok)) |
-            (~df['kategoria'].isin(kategoriak)) |
-            (~df['alkategoria'].isin(alkategoriak)) |
-            (~df['elem'].isin(elemek)) |
-            (~df['partner'].isin(partnerek))] 
-
-    if selected_df.empty:
+    if totals['rows'] == 0:
         st.divider()
         st.error('A kiválasztott szűrési feltételeknek megfelelő adat nem létezik, ellenőrizze a beállított szűrési feltételeket! Kizáró szűrés esetén először meg kell adni a kizárt feltételt!')
     else:
         
-        selected_df['percentage'] = (selected_df['netto'] / selected_df['netto'].sum()) * 100
-        
-        
-# --- SUB DATAFRAMES ---
-
-        df_cat_data = selected_df[['kategoria', 'netto', 'percentage']].groupby(['kategoria']).sum().sort_values(['netto'], ascending=False)
-        df_cat_data['netto'] = df_cat_data['netto'].round(0)
-        df_cat_data['netto'] = df_cat_data['netto'].apply(lambda x: f"{int(x):,} Ft")
-        df_cat_data['percentage'] = df_cat_data['percentage'].round(2)
-        df_cat_data['percentage'] = df_cat_data['percentage'].apply(lambda x: f"{x:.2f}%")
-        df_cat_data = df_cat_data.rename(columns={'netto': 'Nettó', 'percentage': 'Százalék'})
-        
-        df_subcat_data = selected_df[['alkategoria', 'netto', 'percentage']].groupby(['alkategoria']).sum().sort_values(['netto'], ascending=False)
-        df_subcat_data['netto'] = df_subcat_data['netto'].round(0)
-        df_subcat_data['netto'] = df_subcat_data['netto'].apply(lambda x: f"{int(x):,} Ft")
-        df_subcat_data['percentage'] = df_subcat_data['percentage'].round(2)
-        df_subcat_data['percentage'] = df_subcat_data['percentage'].apply(lambda x: f"{x:.2f}%")
-        df_subcat_data = df_subcat_data.rename(columns={'netto': 'Nettó', 'percentage': 'Százalék'})
-        
-        df_item_data = selected_df[['elem', 'netto', 'percentage']].groupby(['elem']).sum().sort_values(['netto'], ascending=False)
-        df_item_data['netto'] = df_item_data['netto'].round(0)
-        df_item_data['netto'] = df_item_data['netto'].apply(lambda x: f"{int(x):,} Ft")
-        df_item_data['percentage'] = df_item_data['percentage'].round(2)
-        df_item_data['percentage'] = df_item_data['percentage'].apply(lambda x: f"{x:.2f}%")
-        df_item_data = df_item_data.rename(columns={'netto': 'Nettó', 'percentage': 'Százalék'})       
-        
-        df_partner_data = selected_df[['partner', 'netto', 'percentage']].groupby(['partner']).sum().sort_values(['netto'], ascending=False)
-        df_partner_data['netto'] = df_partner_data['netto'].round(0)
-        df_partner_data['netto'] = df_partner_data['netto'].apply(lambda x: f"{int(x):,} Ft")
-        df_partner_data['percentage'] = df_partner_data['percentage'].round(2)
-        df_partner_data['percentage'] = df_partner_data['percentage'].apply(lambda x: f"{x:.2f}%")
-        df_partner_data = df_partner_data.rename(columns={'netto': 'Nettó', 'percentage': 'Százalék'})  
-            
 # --- TABS ---
 
-        tabs = st.tabs(['Összesítő adatok','Napsugár diagram','Napsugár diagram összehasonlítás', 'Összesített kategória','Összesített alkategória','Összesített elem','Összehasonlítás','Vizsgált adatok'])
+        tabs = ['Összesítő adatok','Napsugár diagram','Napsugár diagram összehasonlítás', 'Összesített kategória','Összesített alkategória','Összesített elem','Összehasonlítás','Vizsgált adatok']
+        tab = lazy_tabs(tabs, key='income_tab')
         
     ### Osszesito adatok
         
-        with tabs[0]:
+        if tab == tabs[0]:
             
             sumcol1, sumcol2 = st.columns((1,1), gap='large')
             st.write('')
             st.divider()
             st.write('')
             sumcol3, sumcol4, sumcol5 = st.columns((1,1,1), gap='large')
+
+            summary = grouping_sets(dataset, spec, ['kategoria', 'alkategoria', 'elem'])
+            df_cat_data = summary['kategoria']
+            df_subcat_data = summary['alkategoria']
+            df_item_data = summary['elem']
         
             # --- TOTAL INCOME ---
 
             with sumcol1:
                 
-                total_df = selected_df.groupby(['month_year'], as_index=False)['netto'].sum().round(0)
-                total_income = selected_df['netto'].sum().round(0)
+                total_df = with_calendar(aggregate(dataset, spec, ['date_key']).round(0), ['month_year'])
+                total_income = totals['netto'].round(0)
                 
                 st.subheader('Teljes kiadás', divider='grey')
                 total_netto(
@@ -646,8 +792,8 @@ else:
             
             with sumcol2:
                 
-                count_df = selected_df.groupby(['month_year'], as_index=False)['partner'].count()
-                total_count_num = selected_df['partner'].count()
+                count_df = with_calendar(aggregate(dataset, spec, ['date_key'], {'partner': ('partner', 'count')}), ['month_year'])
+                total_count_num = totals['partner']
                 
                 st.subheader('Darabszám', divider='grey')
                 total_count(
@@ -662,183 +808,49 @@ else:
 
             with sumcol3:
                 st.subheader('Kategóriák nettó és százalékos megoszlása', divider='grey')
-                st.table(df_cat_data)
+                st.table(summary_table(df_cat_data))
                 table_formating()
 
             with sumcol4:
                 st.subheader('Alkategóriák nettó és százalékos megoszlása', divider='grey')
-                st.table(df_subcat_data)
+                st.table(summary_table(df_subcat_data))
                 table_formating()
         
             with sumcol5:
                     st.subheader('Elemek nettó és százalékos megoszlása', divider='grey')
-                    st.table(df_item_data)
+                    st.table(summary_table(df_item_data))
                     table_formating()
         
         ### SUNBURST
         
-        with tabs[1]:
+        if tab == tabs[1]:
             
             st.write('')
             sun1, sun2 = st.columns((4,3))
             
             with sun1:
-                sun_data_type = st.selectbox('Kategória vagy pertner alapú csoportosítás', options=['Kategória','Partner'])
-                
-                if sun_data_type == 'Kategória':
-                    path = ['kategoria', 'alkategoria', 'elem']
-                    sunburst(selected_df,path)
-                
-                elif sun_data_type == 'Partner':
-                    sun_data_lvl = st.selectbox('Legkisebb szint', options=['Partner','Kategória','Alkategória','Elem'])
-                    
-                    if sun_data_lvl == 'Partner':
-                        path = ['partner']
-                        
-                    if sun_data_lvl == 'Kategória':
-                        path = ['partner','kategoria']
-                        
-                    if sun_data_lvl == 'Alkategória':
-                        path = ['partner','kategoria', 'alkategoria']
-                        
-                    if sun_data_lvl == 'Elem':
-                        path = ['partner','kategoria', 'alkategoria', 'elem']
-
-                    sunburst(selected_df, path)
+                sunburst_panel(dataset, spec)
                     
             with sun2:
-                sun_data = st.selectbox('Vizsgált szint', options=['Partner','Kategória','Alkategória','Elem'])
-                
-                if sun_data == 'Partner':
-                    st.write('')
-                    st.table(df_partner_data)
-                    table_formating()
-                
-                if sun_data == 'Kategória':
-                    st.write('')
-                    st.table(df_cat_data)
-                    table_formating()
-                
-                if sun_data == 'Alkategória':
-                    st.write('')
-                    st.table(df_subcat_data)
-                    table_formating()
-
-                if sun_data == 'Elem':
-                    st.write('')
-                    st.table(df_item_data)
-                    table_formating()
+                summary_panel(grouping_sets(dataset, spec, ['kategoria', 'alkategoria', 'elem', 'partner']))
                     
                     
         ### SUNBURST COMPARIONS
         
-        with tabs[2]:
-
-            suncomp1, suncomp2 , suncomp3= st.columns((4,2,4))
-            sun_years = sorted(selected_df['year'].unique())
-             
-            sun_type = suncomp2.selectbox('Összehasonlítás', options=['Partner','Kategória','Alkategória','Elem'], help='Alkategória és elem összehasonlításnál érdemes az adatokat előre szűrni, hogy könnyebben áttekinthető legyen a változás!')
-                    
-            with suncomp1:
-                sun_year1 = st.selectbox('Hasonlítási év', options=year, placeholder='Válassz évet')
-                df_sun_year1 = selected_df[selected_df['year'] == sun_year1]
-                
-                if sun_type == 'Partner':
-                    path = ['partner']
-                    
-                if sun_type == 'Kategória':
-                    path = ['kategoria']
-                    
-                if sun_type == 'Alkategória':
-                    path = ['alkategoria']
-                    
-                if sun_type == 'Elem':
-                    path = ['elem']
-
-                sunburst(df_sun_year1, path)                    
-                
-            with suncomp3:
-                sun_year2 = st.selectbox('Vizsgált év', options=year, placeholder='Válassz évet')
-                df_sun_year2 = selected_df[selected_df['year'] == sun_year2]
-
-                if sun_type == 'Partner':
-                    path = ['partner']
-                    
-                if sun_type == 'Kategória':
-                    path = ['kategoria']
-                    
-                if sun_type == 'Alkategória':
-                    path = ['alkategoria']
-                    
-                if sun_type == 'Elem':
-                    path = ['elem']
-
-                sunburst(df_sun_year2, path)   
-            
-            with suncomp2:
-                
-                if sun_type == 'Partner':
-                    df_sun1 = df_sun_year1 = selected_df[selected_df['year'] == sun_year1][['partner', 'netto']].groupby(['partner']).sum()
-                    df_sun2 = df_sun_year2 = selected_df[selected_df['year'] == sun_year2][['partner', 'netto']].groupby(['partner']).sum()
-                    df_sun_merge = pd.merge(left=df_sun1,right=df_sun2,on='partner',how='right')
-                    df_sun_merge['diff'] = (df_sun_merge['netto_y']/df_sun_merge['netto_x'])*100-100
-                    df_sun_merge['diff'] = df_sun_merge['diff'].round(2)
-                    df_sun_merge['netto_y'] = df_sun_merge['netto_y'].round()
-                    df_sun_merge = df_sun_merge.sort_values(['netto_y'], ascending=False)
-                    for key, values in df_sun_merge.iterrows():
-                        netto_y_formatted = f"{values['netto_y']:,.0f} Ft"
-                        diff_formated  = f"{values['diff']:,.2f} %"
-                        st.metric(f'{key}',value=netto_y_formatted ,delta=diff_formated)
-                
-                if sun_type == 'Kategória':
-                    df_sun1 = df_sun_year1 = selected_df[selected_df['year'] == sun_year1][['kategoria', 'netto']].groupby(['kategoria']).sum()
-                    df_sun2 = df_sun_year2 = selected_df[selected_df['year'] == sun_year2][['kategoria', 'netto']].groupby(['kategoria']).sum()
-                    df_sun_merge = pd.merge(left=df_sun1,right=df_sun2,on='kategoria',how='right')
-                    df_sun_merge['diff'] = (df_sun_merge['netto_y']/df_sun_merge['netto_x'])*100-100
-                    df_sun_merge['diff'] = df_sun_merge['diff'].round(2)
-                    df_sun_merge['netto_y'] = df_sun_merge['netto_y'].round()
-                    df_sun_merge = df_sun_merge.sort_values(['netto_y'], ascending=False)
-                    for key, values in df_sun_merge.iterrows():
-                        netto_y_formatted = f"{values['netto_y']:,.0f} Ft"
-                        diff_formated  = f"{values['diff']:,.2f} %"
-                        st.metric(f'{key}',value=netto_y_formatted ,delta=diff_formated)
-                    
-                if sun_type == 'Alkategória':
-                    df_sun1 = df_sun_year1 = selected_df[selected_df['year'] == sun_year1][['alkategoria', 'netto']].groupby(['alkategoria']).sum()
-                    df_sun2 = df_sun_year2 = selected_df[selected_df['year'] == sun_year2][['alkategoria', 'netto']].groupby(['alkategoria']).sum()
-                    df_sun_merge = pd.merge(left=df_sun1,right=df_sun2,on='alkategoria',how='right')
-                    df_sun_merge['diff'] = (df_sun_merge['netto_y']/df_sun_merge['netto_x'])*100-100
-                    df_sun_merge['diff'] = df_sun_merge['diff'].round(2)
-                    df_sun_merge['netto_y'] = df_sun_merge['netto_y'].round()
-                    df_sun_merge = df_sun_merge.sort_values(['netto_y'], ascending=False)
-                    for key, values in df_sun_merge.iterrows():
-                        netto_y_formatted = f"{values['netto_y']:,.0f} Ft"
-                        diff_formated  = f"{values['diff']:,.2f} %"
-                        st.metric(f'{key}',value=netto_y_formatted ,delta=diff_formated)
-
-                if sun_type == 'Elem':
-                    df_sun1 = df_sun_year1 = selected_df[selected_df['year'] == sun_year1][['elem', 'netto']].groupby(['elem']).sum()
-                    df_sun2 = df_sun_year2 = selected_df[selected_df['year'] == sun_year2][['elem', 'netto']].groupby(['elem']).sum()
-                    df_sun_merge = pd.merge(left=df_sun1,right=df_sun2,on='elem',how='right')
-                    df_sun_merge['diff'] = (df_sun_merge['netto_y']/df_sun_merge['netto_x'])*100-100
-                    df_sun_merge['diff'] = df_sun_merge['diff'].round(2)
-                    df_sun_merge['netto_y'] = df_sun_merge['netto_y'].round()
-                    df_sun_merge = df_sun_merge.sort_values(['netto_y'], ascending=False)
-                    for key, values in df_sun_merge.iterrows():
-                        netto_y_formatted = f"{values['netto_y']:,.0f} Ft"
-                        diff_formated  = f"{values['diff']:,.2f} %"
-                        st.metric(f'{key}',value=netto_y_formatted ,delta=diff_formated)
+        if tab == tabs[2]:
+            sunburst_comparison_panel(dataset, spec)
 
         
         ### CATEGORY
         
-        with tabs[3]:
+        if tab == tabs[3]:
 
             catcol1, catcol2 = st.columns((2,1),gap='large')
+            df_cat_data = grouping_sets(dataset, spec, ['kategoria'])['kategoria']
 
             with catcol1:
                 st.subheader('TOP 10 kategória', divider='grey')
-                sum_category = selected_df[['kategoria', 'alkategoria', 'netto']].groupby('kategoria', as_index=False).sum().sort_values('netto',ascending=False).head(10)
+                sum_category = df_cat_data.head(10).reset_index()
                 plot_top10(
                     df=sum_category,
                     x_data='netto',
@@ -849,7 +861,7 @@ else:
                 )
                 
                 st.subheader('Összes kategória alkategóriákra bontva', divider='grey')
-                df_categories = selected_df[['kategoria', 'alkategoria', 'netto']].groupby(['kategoria', 'alkategoria']).sum().sort_values(['kategoria', 'netto'], ascending=False).round(0).reset_index()
+                df_categories = aggregate(dataset, spec, ['kategoria', 'alkategoria']).sort_values(['kategoria', 'netto'], ascending=False).round(0)
                 detailed_bar(
                     df=df_categories,
                     x_data='netto',
@@ -861,18 +873,19 @@ else:
             
             with catcol2:
                     st.subheader('Kategóriák nettó és százalékos megoszlása', divider='grey')
-                    st.table(df_cat_data)
+                    st.table(summary_table(df_cat_data))
                     table_formating()
             
         ### Alkategoria
             
-        with tabs[4]:
+        if tab == tabs[4]:
 
             subcatcol1, subcatcol2 = st.columns((2,1),gap='large')
+            df_subcat_data = grouping_sets(dataset, spec, ['alkategoria'])['alkategoria']
 
             with subcatcol1:
                 st.subheader('TOP 10 alkategória', divider='grey')
-                sum_category = selected_df[['alkategoria', 'elem', 'netto']].groupby('alkategoria', as_index=False).sum().sort_values('netto',ascending=False).head(10)
+                sum_category = df_subcat_data.head(10).reset_index()
                 plot_top10(
                     df=sum_category,
                     x_data='netto',
@@ -883,7 +896,7 @@ else:
                 )
                 
                 st.subheader('Összes alkategória elemekre bontva', divider='grey')
-                df_categories = selected_df[['alkategoria', 'elem', 'netto']].groupby(['alkategoria', 'elem']).sum().sort_values(['alkategoria', 'netto'], ascending=False).round(0).reset_index()
+                df_categories = aggregate(dataset, spec, ['alkategoria', 'elem']).sort_values(['alkategoria', 'netto'], ascending=False).round(0)
                 detailed_bar(
                     df=df_categories,
                     x_data='netto',
@@ -895,18 +908,19 @@ else:
             
             with subcatcol2:
                     st.subheader('Alkategóriák nettó és százalékos megoszlása', divider='grey')
-                    st.table(df_subcat_data)
+                    st.table(summary_table(df_subcat_data))
                     table_formating()
                     
         ### Elem
         
-        with tabs[5]:
+        if tab == tabs[5]:
 
             itemcol1, itemcol2 = st.columns((2,1),gap='large')
+            df_item_data = grouping_sets(dataset, spec, ['elem'])['elem']
 
             with itemcol1:
                 st.subheader('TOP 10 elem', divider='grey')
-                sum_category = selected_df[['elem', 'netto']].groupby('elem', as_index=False).sum().sort_values('netto',ascending=False).head(10)
+                sum_category = df_item_data.head(10).reset_index()
                 plot_top10(
                     df=sum_category,
                     x_data='netto',
@@ -918,12 +932,12 @@ else:
             
             with itemcol2:
                     st.subheader('Elemek nettó és százalékos megoszlása', divider='grey')
-                    st.table(df_item_data)
+                    st.table(summary_table(df_item_data))
                     table_formating()
         
         ### Osszehasonlitas
         
-        with tabs[6]:
+        if tab == tabs[6]:
             
             st.write('')
             
@@ -931,97 +945,11 @@ else:
                 
                 st.write('❗ Az összhasonlítás a fent beállított szűrésektől független! A szükséges szűrési paramétereket alább lehet beállítani. A összehasonlítási szinttől függően jelennek meg a válaszható szűrési lehetőségek!')
             
-            comp_col1, comp_col2 = st.columns((1,4))
-            comp_type = comp_col1.selectbox('Összehasonlítási szint', options=['Kategória','Alkategória','Elem'])
-            
-            comp_years = sorted(df['year'].unique())
-            comp_cats = sorted(df['kategoria'].unique())
-            comp_subcats = sorted(df['alkategoria'].unique())
-            comp_items = sorted(df['elem'].unique())
-            
-            if comp_type == 'Kategória':
-                
-                with comp_col2:
-                    subcomp1, subcomp2 = st.columns((1,2))
-                    
-                    comp_year = sorted(df['year'].unique())
-                    comp_years = subcomp1.multiselect('Összehasonlított évek', options=comp_year, placeholder='Válassz évet')
-                    if len(comp_years) == 0:
-                        comp_years = sorted(df['year'].unique())
-
-                    comp_cat = sorted(df['kategoria'].unique())
-                    comp_cats = subcomp2.multiselect('Összehasonlított kategóriák', options=comp_cat, placeholder='Válassz kategóriát')
-                    if len(comp_cats) == 0:
-                        comp_cats = sorted(df['kategoria'].unique())
-
-                    comp_df = df[
-                        (df['year'].isin(comp_years)) &
-                        (df['kategoria'].isin(comp_cats))
-                        ]
-     
-            elif comp_type == 'Alkategória':
-                
-                with comp_col1:
-                    comp_year = sorted(df['year'].unique())
-                    comp_years = st.multiselect('Összehasonlított évek', options=comp_year, placeholder='Válassz évet')
-                    if len(comp_years) == 0:
-                        comp_years = sorted(df['year'].unique())
-                
-                with comp_col2:
-                    subcomp1, subcomp2 = st.columns((1,2))
-                    
-                    comp_cat = sorted(df['kategoria'].unique())
-                    comp_cats = subcomp1.multiselect('Összehasonlított kategóriák', options=comp_cat, placeholder='Válassz kategóriát')
-                    if len(comp_cats) == 0:
-                        comp_cats = sorted(df['kategoria'].unique())
-                        
-                    comp_subcat = sorted(df.loc[df['kategoria'].isin(comp_cats), 'alkategoria'].unique())
-                    comp_subcats = subcomp2.multiselect('Összehasonlított alkategóriák', options=comp_subcat, placeholder='Válassz alkategóriát')
-                    if len(comp_subcats) == 0:
-                        comp_subcats = sorted(df['alkategoria'].unique())
-
-                comp_df = df[
-                    (df['year'].isin(comp_years)) &
-                    (df['kategoria'].isin(comp_cats)) &
-                    (df['alkategoria'].isin(comp_subcats))
-                    ]
-
-            elif comp_type == 'Elem':
-                
-                with comp_col1:
-                    comp_year = sorted(df['year'].unique())
-                    comp_years = st.multiselect('Összehasonlított évek', options=comp_year, placeholder='Válassz évet')
-                    if len(comp_years) == 0:
-                        comp_years = sorted(df['year'].unique())
-                
-                with comp_col2:
-                    subcomp1, subcomp2 = st.columns((1,2))
-                    
-                    comp_cat = sorted(df['kategoria'].unique())
-                    comp_cats = subcomp1.multiselect('Összehasonlított kategóriák', options=comp_cat, placeholder='Válassz kategóriát')
-                    if len(comp_cats) == 0:
-                        comp_cats = sorted(df['kategoria'].unique())
-                        
-                    comp_subcat = sorted(df.loc[df['kategoria'].isin(comp_cats), 'alkategoria'].unique())
-                    comp_subcats = subcomp2.multiselect('Összehasonlított alkategóriák', options=comp_subcat, placeholder='Válassz alkategóriát')
-                    if len(comp_subcats) == 0:
-                        comp_subcats = sorted(df['alkategoria'].unique())
-
-                    comp_item = sorted(df.loc[df['alkategoria'].isin(comp_subcats), 'elem'].unique())
-                    comp_items = st.multiselect('Összehasonlított elemek', options=comp_item, placeholder='Válassz elemet')
-                    if len(comp_items) == 0:
-                        comp_items = sorted(df['elem'].unique())                    
-                    
-                comp_df = df[
-                    (df['year'].isin(comp_years)) &
-                    (df['kategoria'].isin(comp_cats)) &
-                    (df['alkategoria'].isin(comp_subcats)) &
-                    (df['elem'].isin(comp_items))
-                    ]                         
-   
-            comparison(comp_df, comp_type, comp_years, comp_cats, comp_subcats, comp_items)
+            comparison_panel(dataset)
 
         ### Adatok
         
-        with tabs[7]:
+        if tab == tabs[7]:
+            selected_df = select(dataset, spec)
+            selected_df['percentage'] = (selected_df['netto'] / totals['netto']) * 100
             st.dataframe(selected_df)
\ No newline at end of file
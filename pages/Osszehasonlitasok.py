@@ -7,6 +7,13 @@ from plotly.subplots import make_subplots
 import calendar
 import locale
 
+from utils.analytics import TOTALS, aggregate
+from utils.dataset import HIERARCHY, with_calendar
+from utils.filtering import filter_options, filter_values, select, show_plan, staged_filter_panel
+from utils.registry import get_shared
+from utils.store import restore_session
+from utils.tabs import lazy_tabs
+
 # --- CONFIG ---
 
 st.set_page_config(page_title="Összahasonlítás", layout="wide", page_icon='dragon')
@@ -118,7 +125,7 @@ def sunburst(df, path):
     
     st.plotly_chart(fig, use_container_width=True)
 
-def comp_bar(inc_df, exp_df, emp_df, emp_type, i_years, e_years):
+def comp_bar(income, i_spec, expense, e_spec, emp_df, emp_type, i_years, e_years):
     
     fig1 = make_subplots(
         rows=1, cols=1,
@@ -147,16 +154,16 @@ def comp_bar(inc_df, exp_df, emp_df, emp_type, i_years, e_years):
     def get_hungarian_quarter_name(quarter_number):
         return hungarian_quarters[quarter_number - 1]
 
-    inc_emp_data = inc_df.groupby(['year', 'month', 'quarter' ,'month_year'])['netto'].sum().reset_index()
-    exp_emp_data = exp_df.groupby(['year', 'month', 'quarter' ,'month_year'])['netto'].sum().reset_index()
+    inc_emp_data = aggregate(income, i_spec, ['date_key'])
+    exp_emp_data = aggregate(expense, e_spec, ['date_key'])
     
-    i_monthly_data = pd.merge(inc_emp_data, emp_df, on=['year', 'quarter' ,'month_year'], how='left')
-    e_monthly_data = pd.merge(exp_emp_data, emp_df, on=['year', 'quarter' ,'month_year'], how='left')
+    i_monthly_data = with_calendar(pd.merge(inc_emp_data, emp_df, on=['date_key'], how='left'))
+    e_monthly_data = with_calendar(pd.merge(exp_emp_data, emp_df, on=['date_key'], how='left'))
     
-    q_emp_df = emp_df.groupby(['year','quarter'])[['vam','penzugy','egyeb','osszes']].mean().round(1)
+    q_emp_df = with_calendar(emp_df, ['year', 'quarter']).groupby(['year','quarter'])[['vam','penzugy','egyeb','osszes']].mean().round(1)
     
-    q_inc_emp_data = inc_df.groupby(['year','quarter'])['netto'].sum().reset_index()
-    q_exp_emp_data = exp_df.groupby(['year','quarter'])['netto'].sum().reset_index()
+    q_inc_emp_data = aggregate(income, i_spec, ['year','quarter'])
+    q_exp_emp_data = aggregate(expense, e_spec, ['year','quarter'])
     
     i_quarterly_data = pd.merge(q_inc_emp_data, q_emp_df, on=['year', 'quarter'], how='left')
     e_quarterly_data = pd.merge(q_exp_emp_data, q_emp_df, on=['year', 'quarter'], how='left')
@@ -382,11 +389,11 @@ def multi_comparison(multi_comp_type, i_comp_df, i_comp_years, i_comp_cats, i_co
 
     if multi_comp_type == 'Kategória':
         
-        i_monthly_data = i_comp_df.groupby(['year', 'month', 'kategoria'])['netto'].sum().reset_index()
-        i_quarterly_data = i_comp_df.groupby(['year', 'quarter', 'kategoria'])['netto'].sum().reset_index()
+        i_monthly_data = i_comp_df.groupby(['year', 'month', 'kategoria'], observed=True)['netto'].sum().reset_index()
+        i_quarterly_data = i_comp_df.groupby(['year', 'quarter', 'kategoria'], observed=True)['netto'].sum().reset_index()
         
-        e_monthly_data = e_comp_df.groupby(['year', 'month', 'kategoria'])['netto'].sum().reset_index()
-        e_quarterly_data = e_comp_df.groupby(['year', 'quarter', 'kategoria'])['netto'].sum().reset_index()
+        e_monthly_data = e_comp_df.groupby(['year', 'month', 'kategoria'], observed=True)['netto'].sum().reset_index()
+        e_quarterly_data = e_comp_df.groupby(['year', 'quarter', 'kategoria'], observed=True)['netto'].sum().reset_index()
         
         for category in i_comp_cats:
             for year in i_comp_years:
@@ -478,11 +485,11 @@ def multi_comparison(multi_comp_type, i_comp_df, i_comp_years, i_comp_cats, i_co
         
     elif multi_comp_type == 'Alkategória':
          
-        i_monthly_data = i_comp_df.groupby(['year', 'month', 'alkategoria'])['netto'].sum().reset_index()
-        i_quarterly_data = i_comp_df.groupby(['year', 'quarter', 'alkategoria'])['netto'].sum().reset_index()
+        i_monthly_data = i_comp_df.groupby(['year', 'month', 'alkategoria'], observed=True)['netto'].sum().reset_index()
+        i_quarterly_data = i_comp_df.groupby(['year', 'quarter', 'alkategoria'], observed=True)['netto'].sum().reset_index()
         
-        e_monthly_data = e_comp_df.groupby(['year', 'month', 'alkategoria'])['netto'].sum().reset_index()
-        e_quarterly_data = e_comp_df.groupby(['year', 'quarter', 'alkategoria'])['netto'].sum().reset_index()
+        e_monthly_data = e_comp_df.groupby(['year', 'month', 'alkategoria'], observed=True)['netto'].sum().reset_index()
+        e_quarterly_data = e_comp_df.groupby(['year', 'quarter', 'alkategoria'], observed=True)['netto'].sum().reset_index()
         
         for category in i_comp_cats:
             for year in i_comp_years:
@@ -573,11 +580,11 @@ def multi_comparison(multi_comp_type, i_comp_df, i_comp_years, i_comp_cats, i_co
                 )              
     elif multi_comp_type == 'Elem':
         
-        i_monthly_data = i_comp_df.groupby(['year', 'month', 'elem'])['netto'].sum().reset_index()
-        i_quarterly_data = i_comp_df.groupby(['year', 'quarter', 'elem'])['netto'].sum().reset_index()
+        i_monthly_data = i_comp_df.groupby(['year', 'month', 'elem'], observed=True)['netto'].sum().reset_index()
+        i_quarterly_data = i_comp_df.groupby(['year', 'quarter', 'elem'], observed=True)['netto'].sum().reset_index()
         
-        e_monthly_data = e_comp_df.groupby(['year', 'month', 'elem'])['netto'].sum().reset_index()
-        e_quarterly_data = e_comp_df.groupby(['year', 'quarter', 'elem'])['netto'].sum().reset_index()
+        e_monthly_data = e_comp_df.groupby(['year', 'month', 'elem'], observed=True)['netto'].sum().reset_index()
+        e_quarterly_data = e_comp_df.groupby(['year', 'quarter', 'elem'], observed=True)['netto'].sum().reset_index()
         
         for category in i_comp_cats:
             for year in i_comp_years:
@@ -707,6 +714,266 @@ def table_formating():
                     unsafe_allow_html=True
                 )
 
+@st.fragment
+def employee_panel(income, i_spec, expense, e_spec, df_employees, i_years, e_years):
+    # Income and expense per employee; the group picker only reruns this chart
+    emp_type = st.selectbox('Viszonyítási csoport', options=['Vám','Pénzügy','Egyéb','Összes'])
+
+    comp_bar(
+        income=income,
+        i_spec=i_spec,
+        expense=expense,
+        e_spec=e_spec,
+        emp_df=df_employees,
+        emp_type=emp_type,
+        i_years=i_years,
+        e_years=e_years
+        )
+
+    table_formating()
+
+
+@st.fragment
+def sunburst_comparison_panel(income, i_spec, expense, e_spec):
+    # Income and expense sunbursts of the picked years; the year and level pickers only rerun this panel
+    suncomp1, suncomp2 , suncomp3= st.columns((4,1,4))
+
+    sun_type = suncomp2.selectbox('Összehasonlítás', options=['Partner','Kategória','Alkategória','Elem'], help='Alkategória és elem összehasonlításnál érdemes az adatokat előre szűrni, hogy könnyebben áttekinthető legyen a változás!')
+
+    if sun_type == 'Partner':
+        path = ['partner']
+
+    if sun_type == 'Kategória':
+        path = ['kategoria']
+
+    if sun_type == 'Alkategória':
+        path = ['alkategoria']
+
+    if sun_type == 'Elem':
+        path = ['elem']
+
+    # Yearly totals of the level, each sunburst shows the year picked for it
+    i_yearly = aggregate(income, i_spec, ['year'] + path)
+    e_yearly = aggregate(expense, e_spec, ['year'] + path)
+
+    with suncomp1:
+        sun_year1 = st.selectbox('Bevételi év', options=filter_options(income, 'year'), placeholder='Válassz évet')
+        df_sun_year1 = i_yearly[i_yearly['year'] == sun_year1]
+
+        sunburst(df_sun_year1, path)                    
+
+    with suncomp3:
+        sun_year2 = st.selectbox('Kiadási év', options=filter_options(expense, 'year'), placeholder='Válassz évet')
+        df_sun_year2 = e_yearly[e_yearly['year'] == sun_year2]
+
+        sunburst(df_sun_year2, path)
+
+
+@st.fragment
+def multi_comparison_panel(income, i_spec, expense, e_spec):
+    # Monthly / quarterly comparison of the filtered income and expense with its own filters. The options, the
+    # comparison filters and the charts work on the monthly cube cells of the filtered data, not on its rows.
+    i_cells = aggregate(income, i_spec, ['year', 'month', 'quarter'] + HIERARCHY)
+    e_cells = aggregate(expense, e_spec, ['year', 'month', 'quarter'] + HIERARCHY)
+    st.write('')
+
+    comphead1, comphead2 = st.columns((3,1))
+
+    with comphead1.container(border=True):
+
+        st.write('❗ Az összhasonlítás a fent beállított szűrésektől független! A összehasonlítási szinttől függően jelennek meg a válaszható szűrési lehetőségek!')
+
+    multi_comp_type = comphead2.selectbox('Összehasonlítási szint', options=['Kategória','Alkategória','Elem'])
+
+    i_comp_years = sorted(i_cells['year'].dropna().unique())
+    i_comp_cats = sorted(i_cells['kategoria'].unique())
+    i_comp_subcats = sorted(i_cells['alkategoria'].unique())
+    i_comp_items = sorted(i_cells['elem'].unique())
+
+    e_comp_years = sorted(e_cells['year'].dropna().unique())
+    e_comp_cats = sorted(e_cells['kategoria'].unique())
+    e_comp_subcats = sorted(e_cells['alkategoria'].unique())
+    e_comp_items = sorted(e_cells['elem'].unique())
+
+    if multi_comp_type == 'Kategória':
+
+        subcomp1, subcomp2 = st.columns((1,2))
+
+        i_comp_year = sorted(i_cells['year'].dropna().unique())
+        i_comp_years = subcomp1.multiselect('Bevétel évek', options=i_comp_year, placeholder='Válassz évet')
+        if len(i_comp_years) == 0:
+            i_comp_years = sorted(i_cells['year'].dropna().unique())
+
+        i_comp_cat = sorted(i_cells['kategoria'].unique())
+        i_comp_cats = subcomp2.multiselect('Bevétel kategóriák', options=i_comp_cat, placeholder='Válassz kategóriát')
+        if len(i_comp_cats) == 0:
+            i_comp_cats = sorted(i_cells['kategoria'].unique())
+
+        i_comp_df = i_cells[
+            (i_cells['year'].isin(i_comp_years)) &
+            (i_cells['kategoria'].isin(i_comp_cats))
+            ]
+
+        e_comp_year = sorted(e_cells['year'].dropna().unique())
+        e_comp_years = subcomp1.multiselect('Kiadás évek', options=e_comp_year, placeholder='Válassz évet')
+        if len(e_comp_years) == 0:
+            e_comp_years = sorted(e_cells['year'].dropna().unique())
+
+        e_comp_cat = sorted(e_cells['kategoria'].unique())
+        e_comp_cats = subcomp2.multiselect('Kiadás kategóriák', options=e_comp_cat, placeholder='Válassz kategóriát')
+        if len(e_comp_cats) == 0:
+            e_comp_cats = sorted(e_cells['kategoria'].unique())
+
+        e_comp_df = e_cells[
+            (e_cells['year'].isin(e_comp_years)) &
+            (e_cells['kategoria'].isin(e_comp_cats))
+            ]
+
+    elif multi_comp_type == 'Alkategória':
+
+        subcomp1, subcomp2, subcomp3 = st.columns((1,2,2))
+
+        with subcomp1:
+            i_comp_year = sorted(i_cells['year'].dropna().unique())
+            i_comp_years = st.multiselect('Bevétel évek', options=i_comp_year, placeholder='Válassz évet')
+            if len(i_comp_years) == 0:
+                i_comp_years = sorted(i_cells['year'].dropna().unique())
+
+            e_comp_year = sorted(e_cells['year'].dropna().unique())
+            e_comp_years = st.multiselect('Kiadás évek', options=e_comp_year, placeholder='Válassz évet')
+            if len(e_comp_years) == 0:
+                e_comp_years = sorted(e_cells['year'].dropna().unique())
+
+        with subcomp2:
+
+            i_comp_cat = sorted(i_cells['kategoria'].unique())
+            i_comp_cats = st.multiselect('Bevétel kategóriák', options=i_comp_cat, placeholder='Válassz kategóriát')
+            if len(i_comp_cats) == 0:
+                i_comp_cats = sorted(i_cells['kategoria'].unique())
+
+            e_comp_cat = sorted(e_cells['kategoria'].unique())
+            e_comp_cats = st.multiselect('Kiadás kategóriák', options=e_comp_cat, placeholder='Válassz kategóriát')
+            if len(e_comp_cats) == 0:
+                e_comp_cats = sorted(e_cells['kategoria'].unique())
+
+        with subcomp3:
+
+            i_comp_subcat = sorted(i_cells.loc[i_cells['kategoria'].isin(i_comp_cats), 'alkategoria'].unique())
+            i_comp_subcats = st.multiselect('Bevétel alkategóriák', options=i_comp_subcat, placeholder='Válassz alkategóriát')
+            if len(i_comp_subcats) == 0:
+                i_comp_subcats = sorted(i_cells['alkategoria'].unique())
+
+            e_comp_subcat = sorted(e_cells.loc[e_cells['kategoria'].isin(e_comp_cats), 'alkategoria'].unique())
+            e_comp_subcats = st.multiselect('Kiadás alkategóriák', options=e_comp_subcat, placeholder='Válassz alkategóriát')
+            if len(e_comp_subcats) == 0:
+                e_comp_subcats = sorted(e_cells['alkategoria'].unique())
+
+        i_comp_df = i_cells[
+            (i_cells['year'].isin(i_comp_years)) &
+            (i_cells['kategoria'].isin(i_comp_cats)) &
+            (i_cells['alkategoria'].isin(i_comp_subcats))
+            ]
+
+        e_comp_df = e_cells[
+            (e_cells['year'].isin(e_comp_years)) &
+            (e_cells['kategoria'].isin(e_comp_cats)) &
+            (e_cells['alkategoria'].isin(e_comp_subcats))
+            ]
+
+    elif multi_comp_type == 'Elem':
+
+        subcomp1, subcomp2, subcomp3, subcomp4 = st.columns((1,2,2,2))
+
+        with subcomp1:
+            i_comp_year = sorted(i_cells['year'].dropna().unique())
+            i_comp_years = st.multiselect('Bevétel évek', options=i_comp_year, placeholder='Válassz évet')
+            if len(i_comp_years) == 0:
+                i_comp_years = sorted(i_cells['year'].dropna().unique())
+
+            e_comp_year = sorted(e_cells['year'].dropna().unique())
+            e_comp_years = st.multiselect('Kiadás évek', options=e_comp_year, placeholder='Válassz évet')
+            if len(e_comp_years) == 0:
+                e_comp_years = sorted(e_cells['year'].dropna().unique())
+
+        with subcomp2:                  
+            i_comp_cat = sorted(i_cells['kategoria'].unique())
+            i_comp_cats = st.multiselect('Bevétel kategóriák', options=i_comp_cat, placeholder='Válassz kategóriát')
+            if len(i_comp_cats) == 0:
+                i_comp_cats = sorted(i_cells['kategoria'].unique())
+
+            e_comp_cat = sorted(e_cells['kategoria'].unique())
+            e_comp_cats = st.multiselect('Kiadás kategóriák', options=e_comp_cat, placeholder='Válassz kategóriát')
+            if len(e_comp_cats) == 0:
+                e_comp_cats = sorted(e_cells['kategoria'].unique())
+
+        with subcomp3:
+
+            i_comp_subcat = sorted(i_cells.loc[i_cells['kategoria'].isin(i_comp_cats), 'alkategoria'].unique())
+            i_comp_subcats = st.multiselect('Bevétel alkategóriák', options=i_comp_subcat, placeholder='Válassz alkategóriát')
+            if len(i_comp_subcats) == 0:
+                i_comp_subcats = sorted(i_cells['alkategoria'].unique())
+
+            e_comp_subcat = sorted(e_cells.loc[e_cells['kategoria'].isin(e_comp_cats), 'alkategoria'].unique())
+            e_comp_subcats = st.multiselect('Kiadás alkategóriák', options=e_comp_subcat, placeholder='Válassz alkategóriát')
+            if len(e_comp_subcats) == 0:
+                e_comp_subcats = sorted(e_cells['alkategoria'].unique())
+
+        with subcomp4:
+
+            i_comp_item = sorted(i_cells.loc[i_cells['alkategoria'].isin(i_comp_subcats), 'elem'].unique())
+            i_comp_items = st.multiselect('Bevétel elemek', options=i_comp_item, placeholder='Válassz elemet')
+            if len(i_comp_items) == 0:
+                i_comp_items = sorted(i_cells['elem'].unique())
+
+            e_comp_item = sorted(e_cells.loc[e_cells['alkategoria'].isin(e_comp_subcats), 'elem'].unique())
+            e_comp_items = st.multiselect('Kiadás elemek', options=e_comp_item, placeholder='Válassz elemet')
+            if len(e_comp_items) == 0:
+                e_comp_items = sorted(e_cells['elem'].unique())                
+
+        i_comp_df = i_cells[
+            (i_cells['year'].isin(i_comp_years)) &
+            (i_cells['kategoria'].isin(i_comp_cats)) &
+            (i_cells['alkategoria'].isin(i_comp_subcats)) &
+            (i_cells['elem'].isin(i_comp_items))
+            ]
+
+        e_comp_df = e_cells[
+            (e_cells['year'].isin(e_comp_years)) &
+            (e_cells['kategoria'].isin(e_comp_cats)) &
+            (e_cells['alkategoria'].isin(e_comp_subcats)) &
+            (e_cells['elem'].isin(e_comp_items))
+            ]                       
+
+    multi_comparison(multi_comp_type, i_comp_df, i_comp_years, i_comp_cats, i_comp_subcats, i_comp_items, e_comp_df, e_comp_years, e_comp_cats, e_comp_subcats, e_comp_items)
+
+def income_filter_layout():
+    with st.expander('Bevétel keresés és szűrés'):
+        yfcol1, yfcol2, yfcol3 = st.columns((1,1,1), gap='medium')
+        cfcol1, cfcol2 = st.columns((1,1), gap='medium')
+        cfcol3, cfcol4 = st.columns((1,1), gap='medium')
+        cfcol5, cfcol6 = st.columns((3,1), gap='medium')
+        afcol = st.container()
+
+    return {
+        'year': yfcol1, 'quarter': yfcol2, 'month': yfcol3,
+        'kategoria': cfcol1, 'alkategoria': cfcol2, 'elem': cfcol3,
+        'kat_kod': cfcol4, 'partner': cfcol5, 'mode': cfcol6, 'apply': afcol}
+
+def expense_filter_layout():
+    with st.expander('Kiadás keresés és szűrés'):
+        yfcol1, yfcol2, yfcol3 = st.columns((1,1,1), gap='medium')
+        cfcol1, cfcol2 = st.columns((1,1), gap='medium')
+        cfcol3, cfcol4, cfcol5 = st.columns((1,1,1), gap='medium')
+        pfcol1, pfcol2, = st.columns((3,1))
+        afcol = st.container()
+
+    return {
+        'year': yfcol1, 'quarter': yfcol2, 'month': yfcol3,
+        'kategoria': cfcol1, 'alkategoria': cfcol2, 'elem': cfcol4,
+        'fo_kat': cfcol3, 'kat_kod': cfcol5, 'partner': pfcol1, 'mode': pfcol2, 'apply': afcol}
+
+
+
 # --- PAGE ---
 
 st.title('Összehasonlítás')
@@ -714,6 +981,9 @@ st.divider()
 
 # --- SESSION VARIABLES ---
 
+# Merged data saved by an earlier session
+restore_session()
+
 if 'df_income' and 'df_expense' not in st.session_state:
     st.subheader('Nincs feltöltve vizsgálandó adat.')
     st.write('')
@@ -721,8 +991,8 @@ if 'df_income' and 'df_expense' not in st.session_state:
     st.write('')
     st.page_link('pages/Adatfeltoltes.py', label=' Adatfeltöltés', icon='📝')
 else:
-    df_income = st.session_state['df_income']
-    df_expense = st.session_state['df_expense']
+    income = get_shared('df_income')
+    expense = get_shared('df_expense')
     
 # --- FILTERING ---
 
@@ -730,201 +1000,35 @@ else:
 
 # --- INCOME ---
 
-    with fcol1.expander('Bevétel keresés és szűrés'):
-        yfcol1, yfcol2, yfcol3 = st.columns((1,1,1), gap='medium')
-        cfcol1, cfcol2 = st.columns((1,1), gap='medium')
-        cfcol3, cfcol4 = st.columns((1,1), gap='medium')
-        cfcol5, cfcol6 = st.columns((3,1), gap='medium')
-    
-    # --- TIME FILTERS ---
-
-    quarter_mapping = {'Q1': 1, 'Q2': 2, 'Q3': 3, 'Q4': 4}
-    months_in_quarter = {
-        1: [1, 2, 3],
-        2: [4, 5, 6],
-        3: [7, 8, 9],
-        4: [10, 11, 12]}
-    month_names = { 1: 'Január', 2: 'Február', 3: 'Március', 4: 'Április', 5: 'Május', 6: 'Június', 7: 'Július', 8: 'Augusztus', 9: 'Szeptember', 10: 'Október', 11: 'November', 12: 'December'}
-    
-    i_year = sorted(df_income['year'].unique())
-    i_years = yfcol1.multiselect('Bevétel tárgyév', options=i_year, placeholder='Válassz évet',)
-    if len(i_years) == 0:
-        i_years = sorted(df_income['year'].unique())
-
-    i_quarters = yfcol2.multiselect('Bevétel negyedév', options=quarter_mapping, placeholder='Válassz negyedévet')
-    i_selected_quarters = [quarter_mapping[q] for q in i_quarters]
-    if len(i_selected_quarters) == 0:
-        i_selected_quarters = sorted(df_income['quarter'].unique())
-    
-    i_available_months = set()
-    for q in i_selected_quarters:
-        i_available_months.update(months_in_quarter[q])
-        
-    i_available_month_names = [month_names[m] for m in i_available_months]
-    
-    i_months = yfcol3.multiselect('Bevétel hónap', options=i_available_month_names, placeholder='Válassz hónapot')
-    i_selected_months = [k for k, v in month_names.items() if v in i_months]
-    if len(i_selected_months) == 0:
-        i_selected_months = sorted(df_income['month'].unique())
-
-    # --- CATEGORY FILTERS ---
-
-    i_kategoria = sorted(df_income['kategoria'].unique())
-    i_kategoriak = cfcol1.multiselect('Bevétel kategória', options=i_kategoria, placeholder='Válassz kategóriát')
-    if len(i_kategoriak) == 0:
-        i_kategoriak = sorted(df_income['kategoria'].unique())
-
-    i_alkategoria = sorted(df_income.loc[df_income['kategoria'].isin(i_kategoriak), 'alkategoria'].unique())
-    i_alkategoriak = cfcol2.multiselect('Bevétel alkategória', options=i_alkategoria, placeholder='Válassz alkategóriát')
-    if len(i_alkategoriak) == 0:
-        i_alkategoriak = sorted(df_income['alkategoria'].unique())
-        
-    i_elem = sorted(df_income.loc[df_income['alkategoria'].isin(i_alkategoriak), 'elem'].unique())
-    i_elemek = cfcol3.multiselect('Bevétel kategória elem', options=i_elem, placeholder='Válassz kategória elemet')
-    if len(i_elemek) == 0:
-        i_elemek = sorted(df_income['elem'].unique())
-    
-    i_kat_kod = sorted(df_income['kat_kod'].unique())
-    i_kat_kodok = cfcol4.multiselect('Bevétel kategória kód', options=i_kat_kod, placeholder='Válassz kategória kódot')
-    if len(i_kat_kodok) == 0:
-        i_kat_kodok = sorted(df_income['kat_kod'].unique())
-
-    i_partner = sorted(df_income['partner'].unique())
-    i_partnerek = cfcol5.multiselect('Bevétel partner', options=i_partner, placeholder='Válassz partnert')
-    if len(i_partnerek) == 0:
-        i_partnerek = sorted(df_income['partner'].unique())
+    with fcol1:
+        i_spec = staged_filter_panel(income, income_filter_layout, key='comparison_income_filters', prefix='Bevétel')
+    show_plan(income, i_spec, 'Bevétel szűrési terv')
+    i_totals = aggregate(income, i_spec, values=TOTALS).iloc[0]
 
-    i_in_or_not = cfcol6.selectbox('Bevétel szűrés típusa', options=['Tartalmazza','Kivéve'], help='Kivéve esetén ha nincs megadott feltétel, akkor nem jelenik meg adat! Először adja meg a kivételt, utána álltsa a mezőt Kivéve értékre!')
-    
-    if i_in_or_not == 'Tartalmazza':
-        selected_income_df = df_income[
-            (df_income['year'].isin(i_years)) &
-            (df_income['quarter'].isin(i_selected_quarters)) &
-            (df_income['month'].isin(i_selected_months)) &
-            (df_income['kat_kod'].isin(i_kat_kodok)) &
-            (df_income['kategoria'].isin(i_kategoriak)) &
-            (df_income['alkategoria'].isin(i_alkategoriak)) &
-            (df_income['elem'].isin(i_elemek)) &
-            (df_income['partner'].isin(i_partnerek))]
-    elif i_in_or_not == 'Kivéve':
-       selected_income_df = df_income[
-            (~df_income['year'].isin(i_years)) |
-            (~df_income['quarter'].isin(i_selected_quarters)) |
-            (~df_income['month'].isin(i_selected_months)) |
-            (~df_income['kat_kod'].isin(i_kat_kodok)) |
-            (~df_income['kategoria'].isin(i_kategoriak)) |
-            (~df_income['alkategoria'].isin(i_alkategoriak)) |
-            (~df_income['elem'].isin(i_elemek)) |
-            (~df_income['partner'].isin(i_partnerek))] 
-
-    if selected_income_df.empty:
+    if i_totals['rows'] == 0:
         st.divider()
         st.error('A kiválasztott szűrési feltételeknek megfelelő adat nem létezik, ellenőrizze a beállított szűrési feltételeket! Kizáró szűrés esetén először meg kell adni a kizárt feltételt!')
-    else:
-        selected_income_df['percentage'] = (selected_income_df['netto'] / selected_income_df['netto'].sum()) * 100
         
 # --- EXPENSE ---
     
     # --- FILTERING ---
-    with fcol2.expander('Kiadás keresés és szűrés'):
-        yfcol1, yfcol2, yfcol3 = st.columns((1,1,1), gap='medium')
-        cfcol1, cfcol2 = st.columns((1,1), gap='medium')
-        cfcol3, cfcol4, cfcol5 = st.columns((1,1,1), gap='medium')
-        pfcol1, pfcol2, = st.columns((3,1))
-    
-    # --- TIME FILTERS ---
-    
-    e_year = sorted(df_expense['year'].unique())
-    e_years = yfcol1.multiselect('Kiadás tárgyév', options=e_year, placeholder='Válassz évet',)
-    if len(e_years) == 0:
-        e_years = sorted(df_expense['year'].unique())
-
-    e_quarters = yfcol2.multiselect('Kiadás negyedév', options=quarter_mapping, placeholder='Válassz negyedévet')
-    e_selected_quarters = [quarter_mapping[q] for q in e_quarters]
-    if len(e_selected_quarters) == 0:
-        e_selected_quarters = sorted(df_expense['quarter'].unique())
-    
-    e_available_months = set()
-    for q in e_selected_quarters:
-        e_available_months.update(months_in_quarter[q])
-        
-    e_available_month_names = [month_names[m] for m in e_available_months]
-    
-    e_months = yfcol3.multiselect('Kiadás hónap', options=e_available_month_names, placeholder='Válassz hónapot')
-    e_selected_months = [k for k, v in month_names.items() if v in e_months]
-    if len(e_selected_months) == 0:
-        e_selected_months = sorted(df_expense['month'].unique())
-
-# --- CATEGORY FILTERS ---
-
-    e_kategoria = sorted(df_expense['kategoria'].unique())
-    e_kategoriak = cfcol1.multiselect('Kiadás kategória', options=e_kategoria, placeholder='Válassz kategóriát')
-    if len(e_kategoriak) == 0:
-        e_kategoriak = sorted(df_expense['kategoria'].unique())
-
-    e_alkategoria = sorted(df_expense.loc[df_expense['kategoria'].isin(e_kategoriak), 'alkategoria'].unique())
-    e_alkategoriak = cfcol2.multiselect('Kiadás alkategória', options=e_alkategoria, placeholder='Válassz alkategóriát')
-    if len(e_alkategoriak) == 0:
-        e_alkategoriak = sorted(df_expense['alkategoria'].unique())
-        
-    e_elem = sorted(df_expense.loc[df_expense['alkategoria'].isin(e_alkategoriak), 'elem'].unique())
-    e_elemek = cfcol4.multiselect('Kiadás kategória elem', options=e_elem, placeholder='Válassz kategória elemet')
-    if len(e_elemek) == 0:
-        e_elemek = sorted(df_expense['elem'].unique())
-
-    e_fo_kat = sorted(df_expense['fo_kat'].unique())
-    e_fo_katok = cfcol3.multiselect('Kiadás fő kategória', options=e_fo_kat, placeholder='Válassz fő kategóriát', help='A 0. kategória a nem besorolt!')
-    if len(e_fo_katok) == 0:
-        e_fo_katok = sorted(df_expense['fo_kat'].unique())
-    
-    e_kat_kod = sorted(df_expense['kat_kod'].unique())
-    e_kat_kodok = cfcol5.multiselect('Kiadás kategória kód', options=e_kat_kod, placeholder='Válassz kategória kódot')
-    if len(e_kat_kodok) == 0:
-        e_kat_kodok = sorted(df_expense['kat_kod'].unique())
-
-    e_partner = sorted(df_expense['partner'].unique())
-    e_partnerek = pfcol1.multiselect('Kiadás partner', options=e_partner, placeholder='Válassz partnert')
-    if len(e_partnerek) == 0:
-        e_partnerek = sorted(df_expense['partner'].unique())
+    with fcol2:
+        e_spec = staged_filter_panel(expense, expense_filter_layout, key='comparison_expense_filters', prefix='Kiadás')
+    show_plan(expense, e_spec, 'Kiadás szűrési terv')
+    e_totals = aggregate(expense, e_spec, values=TOTALS).iloc[0]
 
-    e_in_or_not = pfcol2.selectbox('Kiadás szűrés típusa', options=['Tartalmazza','Kivéve'], help='Kivéve esetén ha nincs megadott feltétel, akkor nem jelenik meg adat! Először adja meg a kivételt, utána álltsa a mezőt Kivéve értékre!')
-    
-    if e_in_or_not == 'Tartalmazza':
-        selected_expense_df = df_expense[
-            (df_expense['year'].isin(e_years)) &
-            (df_expense['quarter'].isin(e_selected_quarters)) &
-            (df_expense['month'].isin(e_selected_months)) &
-            (df_expense['fo_kat'].isin(e_fo_katok)) &
-            (df_expense['kat_kod'].isin(e_kat_kodok)) &
-            (df_expense['kategoria'].isin(e_kategoriak)) &
-            (df_expense['alkategoria'].isin(e_alkategoriak)) &
-            (df_expense['elem'].isin(e_elemek)) &
-            (df_expense['partner'].isin(e_partnerek))]
-    elif e_in_or_not == 'Kivéve':
-       selected_expense_df = df_expense[
-            (~df_expense['year'].isin(e_years)) |
-            (~df_expense['quarter'].isin(e_selected_quarters)) |
-            (~df_expense['month'].isin(e_selected_months)) |
-            (~df_expense['fo_kat'].isin(e_fo_katok)) |
-            (~df_expense['kat_kod'].isin(e_kat_kodok)) |
-            (~df_expense['kategoria'].isin(e_kategoriak)) |
-            (~df_expense['alkategoria'].isin(e_alkategoriak)) |
-            (~df_expense['elem'].isin(e_elemek)) |
-            (~df_expense['partner'].isin(e_partnerek))] 
-
-    if selected_expense_df.empty:
+    if e_totals['rows'] == 0:
         st.divider()
         st.error('A kiválasztott szűrési feltételeknek megfelelő adat nem létezik, ellenőrizze a beállított szűrési feltételeket! Kizáró szűrés esetén először meg kell adni a kizárt feltételt!')
-    else:
-        selected_expense_df['percentage'] = (selected_expense_df['netto'] / selected_expense_df['netto'].sum()) * 100
       
 # --- TABS ---
         
-    tabs = st.tabs(['Összesítő adatok','Napsugár diagram','Összehasonlítás','Vizsgált adatok'])
+    tabs = ['Összesítő adatok','Napsugár diagram','Összehasonlítás','Vizsgált adatok']
+    tab = lazy_tabs(tabs, key='comparison_tab')
     
     ### Osszesito adatok
         
-    with tabs[0]:
+    if tab == tabs[0]:
         
         sumcol1, sumcol2 = st.columns((1,1), gap='large')
         st.write('')
@@ -933,8 +1037,8 @@ else:
 
         with sumcol1:
             
-            total_df = selected_income_df.groupby(['month_year'], as_index=False)['netto'].sum().round(0)
-            total_expense = selected_income_df['netto'].sum().round(0)
+            total_df = with_calendar(aggregate(income, i_spec, ['date_key']).round(0), ['month_year'])
+            total_expense = i_totals['netto'].round(0)
             
             st.subheader('Teljes bevétel', divider='grey')
             total_netto(
@@ -951,8 +1055,8 @@ else:
             
         with sumcol2:
             
-            total_df = selected_expense_df.groupby(['month_year'], as_index=False)['netto'].sum().round(0)
-            total_income = selected_expense_df['netto'].sum().round(0)
+            total_df = with_calendar(aggregate(expense, e_spec, ['date_key']).round(0), ['month_year'])
+            total_income = e_totals['netto'].round(0)
             
             st.subheader('Teljes kiadás', divider='grey')
             total_netto(
@@ -976,242 +1080,34 @@ else:
             st.write('')
             st.page_link('pages/Adatfeltoltes.py', label=' Adatfeltöltés', icon='📝')
         else:
-            df_employees = st.session_state['df_employees']
-            emp_type = st.selectbox('Viszonyítási csoport', options=['Vám','Pénzügy','Egyéb','Összes'])
-            
-            comp_bar(
-                inc_df=selected_income_df,
-                exp_df=selected_expense_df,
-                emp_df=df_employees,
-                emp_type=emp_type,
-                i_years=i_years,
-                e_years=e_years
+            df_employees = get_shared('df_employees')
+            employee_panel(
+                income,
+                i_spec,
+                expense,
+                e_spec,
+                df_employees,
+                i_years=filter_values(income, i_spec, 'year'),
+                e_years=filter_values(expense, e_spec, 'year')
                 )
-            
-            table_formating()
         
-        ### SUNBURST COMPARIONS
+    ### SUNBURST COMPARIONS
+    
+    if tab == tabs[1]:
+        sunburst_comparison_panel(income, i_spec, expense, e_spec)
         
-        with tabs[1]:
-
-            suncomp1, suncomp2 , suncomp3= st.columns((4,1,4))
-             
-            sun_type = suncomp2.selectbox('Összehasonlítás', options=['Partner','Kategória','Alkategória','Elem'], help='Alkategória és elem összehasonlításnál érdemes az adatokat előre szűrni, hogy könnyebben áttekinthető legyen a változás!')
-                    
-            with suncomp1:
-                sun_year1 = st.selectbox('Bevételi év', options=i_year, placeholder='Válassz évet')
-                df_sun_year1 = selected_income_df[selected_income_df['year'] == sun_year1]
-                
-                if sun_type == 'Partner':
-                    path = ['partner']
-                    
-                if sun_type == 'Kategória':
-                    path = ['kategoria']
-                    
-                if sun_type == 'Alkategória':
-                    path = ['alkategoria']
-                    
-                if sun_type == 'Elem':
-                    path = ['elem']
-
-                sunburst(df_sun_year1, path)                    
-                
-            with suncomp3:
-                sun_year2 = st.selectbox('Kiadási év', options=e_year, placeholder='Válassz évet')
-                df_sun_year2 = selected_expense_df[selected_expense_df['year'] == sun_year2]
-
-                if sun_type == 'Partner':
-                    path = ['partner']
-                    
-                if sun_type == 'Kategória':
-                    path = ['kategoria']
-                    
-                if sun_type == 'Alkategória':
-                    path = ['alkategoria']
-                    
-                if sun_type == 'Elem':
-                    path = ['elem']
-
-                sunburst(df_sun_year2, path)
-            
-        with tabs[2]:
-            
-            st.write('')
-            
-            comphead1, comphead2 = st.columns((3,1))
-            
-            with comphead1.container(border=True):
-                
-                st.write('❗ Az összhasonlítás a fent beállított szűrésektől független! A összehasonlítási szinttől függően jelennek meg a válaszható szűrési lehetőségek!')
-            
-            multi_comp_type = comphead2.selectbox('Összehasonlítási szint', options=['Kategória','Alkategória','Elem'])
-            
-            i_comp_years = sorted(selected_income_df['year'].unique())
-            i_comp_cats = sorted(selected_income_df['kategoria'].unique())
-            i_comp_subcats = sorted(selected_income_df['alkategoria'].unique())
-            i_comp_items = sorted(selected_income_df['elem'].unique())
-            
-            e_comp_years = sorted(selected_expense_df['year'].unique())
-            e_comp_cats = sorted(selected_expense_df['kategoria'].unique())
-            e_comp_subcats = sorted(selected_expense_df['alkategoria'].unique())
-            e_comp_items = sorted(selected_expense_df['elem'].unique())
-            
-            if multi_comp_type == 'Kategória':
-                
-                subcomp1, subcomp2 = st.columns((1,2))
-                
-                i_comp_year = sorted(selected_income_df['year'].unique())
-                i_comp_years = subcomp1.multiselect('Bevétel évek', options=i_comp_year, placeholder='Válassz évet')
-                if len(i_comp_years) == 0:
-                    i_comp_years = sorted(selected_income_df['year'].unique())
-
-                i_comp_cat = sorted(selected_income_df['kategoria'].unique())
-                i_comp_cats = subcomp2.multiselect('Bevétel kategóriák', options=i_comp_cat, placeholder='Válassz kategóriát')
-                if len(i_comp_cats) == 0:
-                    i_comp_cats = sorted(selected_income_df['kategoria'].unique())
-
-                i_comp_df = selected_income_df[
-                    (selected_income_df['year'].isin(i_comp_years)) &
-                    (selected_income_df['kategoria'].isin(i_comp_cats))
-                    ]
-                
-                e_comp_year = sorted(selected_expense_df['year'].unique())
-                e_comp_years = subcomp1.multiselect('Kiadás évek', options=e_comp_year, placeholder='Válassz évet')
-                if len(e_comp_years) == 0:
-                    e_comp_years = sorted(selected_expense_df['year'].unique())
-
-                e_comp_cat = sorted(selected_expense_df['kategoria'].unique())
-                e_comp_cats = subcomp2.multiselect('Kiadás kategóriák', options=e_comp_cat, placeholder='Válassz kategóriát')
-                if len(e_comp_cats) == 0:
-                    e_comp_cats = sorted(selected_expense_df['kategoria'].unique())
-
-                e_comp_df = selected_expense_df[
-                    (selected_expense_df['year'].isin(e_comp_years)) &
-                    (selected_expense_df['kategoria'].isin(e_comp_cats))
-                    ]
-     
-            elif multi_comp_type == 'Alkategória':
-                
-                subcomp1, subcomp2, subcomp3 = st.columns((1,2,2))
-                
-                with subcomp1:
-                    i_comp_year = sorted(selected_income_df['year'].unique())
-                    i_comp_years = st.multiselect('Bevétel évek', options=i_comp_year, placeholder='Válassz évet')
-                    if len(i_comp_years) == 0:
-                        i_comp_years = sorted(selected_income_df['year'].unique())
-                        
-                    e_comp_year = sorted(selected_expense_df['year'].unique())
-                    e_comp_years = st.multiselect('Kiadás évek', options=e_comp_year, placeholder='Válassz évet')
-                    if len(e_comp_years) == 0:
-                        e_comp_years = sorted(selected_expense_df['year'].unique())
-                
-                with subcomp2:
-                    
-                    i_comp_cat = sorted(selected_income_df['kategoria'].unique())
-                    i_comp_cats = st.multiselect('Bevétel kategóriák', options=i_comp_cat, placeholder='Válassz kategóriát')
-                    if len(i_comp_cats) == 0:
-                        i_comp_cats = sorted(selected_income_df['kategoria'].unique())
-                        
-                    e_comp_cat = sorted(selected_expense_df['kategoria'].unique())
-                    e_comp_cats = st.multiselect('Kiadás kategóriák', options=e_comp_cat, placeholder='Válassz kategóriát')
-                    if len(e_comp_cats) == 0:
-                        e_comp_cats = sorted(selected_expense_df['kategoria'].unique())
-                
-                with subcomp3:
-                 
-                    i_comp_subcat = sorted(selected_income_df.loc[selected_income_df['kategoria'].isin(i_comp_cats), 'alkategoria'].unique())
-                    i_comp_subcats = st.multiselect('Bevétel alkategóriák', options=i_comp_subcat, placeholder='Válassz alkategóriát')
-                    if len(i_comp_subcats) == 0:
-                        i_comp_subcats = sorted(selected_income_df['alkategoria'].unique())
-                        
-                    e_comp_subcat = sorted(selected_expense_df.loc[selected_expense_df['kategoria'].isin(e_comp_cats), 'alkategoria'].unique())
-                    e_comp_subcats = st.multiselect('Kiadás alkategóriák', options=e_comp_subcat, placeholder='Válassz alkategóriát')
-                    if len(e_comp_subcats) == 0:
-                        e_comp_subcats = sorted(selected_expense_df['alkategoria'].unique())
-
-                i_comp_df = selected_income_df[
-                    (selected_income_df['year'].isin(i_comp_years)) &
-                    (selected_income_df['kategoria'].isin(i_comp_cats)) &
-                    (selected_income_df['alkategoria'].isin(i_comp_subcats))
-                    ]
-
-                e_comp_df = selected_expense_df[
-                    (selected_expense_df['year'].isin(e_comp_years)) &
-                    (selected_expense_df['kategoria'].isin(e_comp_cats)) &
-                    (selected_expense_df['alkategoria'].isin(e_comp_subcats))
-                    ]
-
-            elif multi_comp_type == 'Elem':
-                
-                subcomp1, subcomp2, subcomp3, subcomp4 = st.columns((1,2,2,2))
-                
-                with subcomp1:
-                    i_comp_year = sorted(selected_income_df['year'].unique())
-                    i_comp_years = st.multiselect('Bevétel évek', options=i_comp_year, placeholder='Válassz évet')
-                    if len(i_comp_years) == 0:
-                        i_comp_years = sorted(selected_income_df['year'].unique())
-                        
-                    e_comp_year = sorted(selected_expense_df['year'].unique())
-                    e_comp_years = st.multiselect('Kiadás évek', options=e_comp_year, placeholder='Válassz évet')
-                    if len(e_comp_years) == 0:
-                        e_comp_years = sorted(selected_expense_df['year'].unique())
-                
-                with subcomp2:                  
-                    i_comp_cat = sorted(selected_income_df['kategoria'].unique())
-                    i_comp_cats = st.multiselect('Bevétel kategóriák', options=i_comp_cat, placeholder='Válassz kategóriát')
-                    if len(i_comp_cats) == 0:
-                        i_comp_cats = sorted(selected_income_df['kategoria'].unique())
-                        
-                    e_comp_cat = sorted(selected_expense_df['kategoria'].unique())
-                    e_comp_cats = st.multiselect('Kiadás kategóriák', options=e_comp_cat, placeholder='Válassz kategóriát')
-                    if len(e_comp_cats) == 0:
-                        e_comp_cats = sorted(selected_expense_df['kategoria'].unique())
-                
-                with subcomp3:
-                 
-                    i_comp_subcat = sorted(selected_income_df.loc[selected_income_df['kategoria'].isin(i_comp_cats), 'alkategoria'].unique())
-                    i_comp_subcats = st.multiselect('Bevétel alkategóriák', options=i_comp_subcat, placeholder='Válassz alkategóriát')
-                    if len(i_comp_subcats) == 0:
-                        i_comp_subcats = sorted(selected_income_df['alkategoria'].unique())
-                        
-                    e_comp_subcat = sorted(selected_expense_df.loc[selected_expense_df['kategoria'].isin(e_comp_cats), 'alkategoria'].unique())
-                    e_comp_subcats = st.multiselect('Kiadás alkategóriák', options=e_comp_subcat, placeholder='Válassz alkategóriát')
-                    if len(e_comp_subcats) == 0:
-                        e_comp_subcats = sorted(selected_expense_df['alkategoria'].unique())
-
-                with subcomp4:
-                
-                    i_comp_item = sorted(selected_income_df.loc[selected_income_df['alkategoria'].isin(i_comp_subcats), 'elem'].unique())
-                    i_comp_items = st.multiselect('Bevétel elemek', options=i_comp_item, placeholder='Válassz elemet')
-                    if len(i_comp_items) == 0:
-                        i_comp_items = sorted(selected_income_df['elem'].unique())
-                        
-                    e_comp_item = sorted(selected_expense_df.loc[selected_expense_df['alkategoria'].isin(e_comp_subcats), 'elem'].unique())
-                    e_comp_items = st.multiselect('Kiadás elemek', options=e_comp_item, placeholder='Válassz elemet')
-                    if len(e_comp_items) == 0:
-                        comp_items = sorted(selected_expense_df['elem'].unique())                
-                
-                i_comp_df = selected_income_df[
-                    (selected_income_df['year'].isin(i_comp_years)) &
-                    (selected_income_df['kategoria'].isin(i_comp_cats)) &
-                    (selected_income_df['alkategoria'].isin(i_comp_subcats)) &
-                    (selected_income_df['elem'].isin(i_comp_items))
-                    ]
-
-                e_comp_df = selected_expense_df[
-                    (selected_expense_df['year'].isin(e_comp_years)) &
-                    (selected_expense_df['kategoria'].isin(e_comp_cats)) &
-                    (selected_expense_df['alkategoria'].isin(e_comp_subcats)) &
-                    (selected_expense_df['elem'].isin(e_comp_items))
-                    ]                       
-   
-            multi_comparison(multi_comp_type, i_comp_df, i_comp_years, i_comp_cats, i_comp_subcats, i_comp_items, e_comp_df, e_comp_years, e_comp_cats, e_comp_subcats, e_comp_items)
-            
-        with tabs[3]:
-            st.subheader('Bevételi adatok')
-            st.write(selected_income_df)
-            
-            st.write('')
-            
-            st.subheader('Kiadási adatok')
-            st.write(selected_expense_df)
\ No newline at end of file
+    if tab == tabs[2]:
+        multi_comparison_panel(income, i_spec, expense, e_spec)
+        
+    if tab == tabs[3]:
+        selected_income_df = select(income, i_spec)
+        selected_income_df['percentage'] = (selected_income_df['netto'] / i_totals['netto']) * 100
+        st.subheader('Bevételi adatok')
+        st.write(selected_income_df)
+        
+        st.write('')
+        
+        selected_expense_df = select(expense, e_spec)
+        selected_expense_df['percentage'] = (selected_expense_df['netto'] / e_totals['netto']) * 100
+        st.subheader('Kiadási adatok')
+        st.write(selected_expense_df)
\ No newline at end of file
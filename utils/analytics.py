@@ -0,0 +1,82 @@
+import pandas as pd
+
+from utils.dataset import CUBE_MEASURES, DATE_PARTS, HIERARCHY
+from utils.filtering import filter_mask
+
+# --- AGGREGATION ---
+
+# Output column -> (fact column, 'sum' | 'count')
+NETTO = {'netto': ('netto', 'sum')}
+
+# Page totals: netto, the rows with a partner and all matching rows (date_key is 0 for a missing date, never missing)
+TOTALS = {'netto': ('netto', 'sum'), 'partner': ('partner', 'count'), 'rows': ('date_key', 'count')}
+
+
+def cube_answers(dataset, spec, by=(), values=NETTO):
+    # Whether the cube holds everything the aggregation needs: filters and groups on its dimensions (or their
+    # hierarchy / calendar attributes), sums of its measures and counts of its dimensions
+    cube = dataset.cube
+    if cube is None:
+        return False
+    dims = [col for col in cube.fact.columns if col not in CUBE_MEASURES + ['rows']]
+
+    def covered(col):
+        return col in dims or col in HIERARCHY or col in DATE_PARTS
+
+    return (all(covered(col) for col in by) and all(covered(col) for col, _ in spec.filters)
+            and all(col in CUBE_MEASURES if func == 'sum' else col in dims for col, func in values.values()))
+
+
+def aggregate(dataset, spec, by=(), values=NETTO, engine=None):
+    # Group totals of the fact rows matching the FilterSpec: one row per observed `by` combination, in group order.
+    # Answered from the cube when it can be, so the cost depends on the number of cube cells, not of fact rows.
+    by = list(by)
+    if engine is None:
+        engine = 'cube' if cube_answers(dataset, spec, by, values) else 'pandas'
+    if engine == 'cube':
+        return _aggregate_cube(dataset, spec, by, values)
+    return _aggregate_pandas(dataset, spec, by, values)
+
+
+def grouping_sets(dataset, spec, levels, value='netto'):
+    # Totals and shares of several groupings (e.g. kategoria, alkategoria, elem, partner) from one pass over the
+    # matching rows: they are summed once per kat_kod and non-hierarchy level, every level is rolled up from that.
+    # level -> frame indexed by the level with numeric `value` and 'percentage' columns, largest first.
+    others = [col for col in levels if col not in HIERARCHY]
+    source = dataset.cube if cube_answers(dataset, spec, ['kat_kod'] + others, {value: (value, 'sum')}) else dataset
+    view = source.resolve(filter_mask(source, spec), columns=[], dates=[])
+    # Rows with a missing partner still count in the category totals
+    base = view.groupby(['kat_kod'] + others, observed=True, dropna=False)[value].sum().reset_index()
+    total = base[value].sum()
+    codes = base['kat_kod'].cat.codes.to_numpy()
+    tables = {}
+    for col in levels:
+        keys = pd.Series(dataset.hierarchy(col, codes), name=col) if col in HIERARCHY else base[col]
+        table = base[value].groupby(keys, observed=True).sum().to_frame().sort_values(value, ascending=False)
+        table['percentage'] = table[value] / total * 100
+        tables[col] = table
+    return tables
+
+
+def _aggregate_pandas(dataset, spec, by, values):
+    view = dataset.resolve(filter_mask(dataset, spec),
+                           columns=[col for col in by if col in HIERARCHY],
+                           dates=[col for col in by if col in DATE_PARTS])
+    aggregations = {out: (col, func) for out, (col, func) in values.items()}
+    if not by:
+        return pd.DataFrame({out: [getattr(view[col], func)()] for out, (col, func) in aggregations.items()})
+    return view.groupby(by, observed=True).agg(**aggregations).reset_index()
+
+
+def _aggregate_cube(dataset, spec, by, values):
+    # Roll-up of the matching cube cells: sums are summed, a count is the row count of the cells where it is present
+    cube = dataset.cube
+    view = cube.resolve(filter_mask(cube, spec),
+                        columns=[col for col in by if col in HIERARCHY],
+                        dates=[col for col in by if col in DATE_PARTS])
+    frame = view[by].copy(deep=False)
+    for out, (col, func) in values.items():
+        frame[out] = view[col] if func == 'sum' else view['rows'].where(view[col].notna(), 0)
+    if not by:
+        return pd.DataFrame({out: [frame[out].sum()] for out in values})
+    return frame.groupby(by, observed=True)[list(values)].sum().reset_index()
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from utils.dataset import HIERARCHY, Dataset, date_key, split_fact
+
+# --- DATAFRAME CLEANING ---
+
+# Text columns of the fact tables and the value used for missing cells
+INCOME_TEXT_COLUMNS = {
+    'kat_kod': 'hiányos'}
+
+EXPENSE_TEXT_COLUMNS = {
+    'bizonylat_szam': '',
+    'megjegyzes': '',
+    'kat_kod': 'hiányos'}
+
+# Low-cardinality dimension columns, stored as categoricals so filters and groupbys work on integer codes
+INCOME_DIMENSIONS = ['partner', 'deviza', 'kat_kod']
+EXPENSE_DIMENSIONS = ['partner', 'forras', 'kat_kod']
+
+
+def to_text(s, fill, integral=False):
+    # str() of every present value and `fill` for the missing ones.
+    # Only the distinct values are converted, the column itself is rebuilt with a single take.
+    # With `integral`, whole floats are written as integers: an integer code column with empty cells is read
+    # as float, its 101.0 has to match the code 101 of the other table.
+    codes, uniques = pd.factorize(s)
+    if integral:
+        uniques = [int(value) if isinstance(value, float) and value.is_integer() else value for value in uniques]
+    text = np.empty(len(uniques) + 1, dtype=object)
+    text[:-1] = [str(value) for value in uniques]
+    text[-1] = fill
+    return pd.Series(text[codes], index=s.index, name=s.name)
+
+
+def prepare_exp_data(df):
+    # Uploaded expense rows as they are stored before the merge
+    df = df.copy()
+    df['bizonylat_szam'] = to_text(df['bizonylat_szam'], '')
+    df['megjegyzes'] = to_text(df['megjegyzes'], '')
+    df['kat_kod'] = to_text(df['kat_kod'], None, integral=True).str.strip()
+    return df
+
+
+def prepare_exp_cat(df):
+    df = df.copy()
+    df['kat_kod'] = to_text(df['kat_kod'], None, integral=True).str.strip()
+    return df
+
+
+def build_frame(df_data, text_columns, dimensions):
+    # Shared income / expense pipeline: calendar key, text columns and categorical dimension codes
+    df = df_data.copy()
+
+    df['date_key'] = date_key(df['datum'])
+
+    for col, fill in text_columns.items():
+        df[col] = to_text(df[col], fill, integral=col == 'kat_kod')
+    for col in dimensions:
+        df[col] = df[col].astype('category')
+    return df
+
+
+def build_categories(kat_kod, df_cat):
+    # Category dimension: one row per kat_kod code of the fact table, in code order.
+    # Codes missing from the category table get 'hiányos' on every level, like the old left merge.
+    df_cat = df_cat.assign(kat_kod=to_text(df_cat['kat_kod'], None, integral=True)).dropna(subset=['kat_kod'])
+    df_cat = df_cat.drop_duplicates('kat_kod').set_index('kat_kod')
+    categories = df_cat.reindex(kat_kod.cat.categories)[HIERARCHY]
+    for col in HIERARCHY:
+        categories[col] = to_text(categories[col], 'hiányos').astype('category')
+    categories.index.name = 'kat_kod'
+    return categories
+
+
+def build_dataset(df, df_cat):
+    # Slim fact table of the filter columns and measures, the rest of the columns go to the side table
+    fact, details = split_fact(df)
+    dataset = Dataset(fact, build_categories(fact['kat_kod'], df_cat), details=details, order=list(df.columns))
+    dataset.prepare()
+    return dataset
+
+
+def income_clean(df_inc_data, df_inc_cat):
+    df = build_frame(df_inc_data, INCOME_TEXT_COLUMNS, INCOME_DIMENSIONS)
+    df = df.rename(columns={'teljes_forintban': 'netto'})
+    return build_dataset(df, df_inc_cat)
+
+
+def expense_clean(df_exp_data, df_exp_cat):
+    df = build_frame(df_exp_data, EXPENSE_TEXT_COLUMNS, EXPENSE_DIMENSIONS)
+    df['fo_kat'] = pd.to_numeric(df['fo_kat'], errors='coerce').fillna(0).astype(int)
+    return build_dataset(df, df_exp_cat)
+
+
+def recategorize(dataset, df_cat):
+    # New category mapping for already merged data: only the dimension is rebuilt, the fact table, its
+    # filter index and cube are shared
+    return Dataset(dataset.fact, build_categories(dataset.fact['kat_kod'], df_cat), dataset.calendar, dataset.index,
+                   dataset.cube_fact, dataset.details, dataset.order)
@@ -0,0 +1,261 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from utils.indexing import FilterIndex
+
+# --- STAR SCHEMA ---
+
+# Category hierarchy, stored once per kat_kod in the category dimension
+HIERARCHY = ['kategoria', 'alkategoria', 'elem']
+
+# Attributes of the calendar dimension, stored once per date_key
+DATE_PARTS = ['year', 'month', 'quarter', 'month_year']
+
+# Date parts added to resolved views by default; month_year is only looked up when a chart needs the label
+RESOLVED_DATE_PARTS = ['year', 'month', 'quarter']
+
+# Fact columns behind the page filters; the filter index, the widget options and the cube cover the ones present
+FILTER_COLUMNS = ['kat_kod', 'date_key', 'partner', 'fo_kat']
+
+# Summed fact columns of the cube, next to the row count 'rows'
+CUBE_MEASURES = ['netto']
+
+# Columns of the slim fact table. The other upload columns (datum, prices, document numbers, notes) are only
+# shown in the data view and are kept in a row-aligned side table. Filters and groupbys use date_key and the
+# calendar, the day itself is only shown.
+FACT_COLUMNS = FILTER_COLUMNS + CUBE_MEASURES
+
+# Process-unique dataset versions, never reused (unlike id())
+_versions = itertools.count(1)
+
+# --- CALENDAR ---
+
+def date_key(datum):
+    # Year and month as one int32 (yyyymm), 0 for missing dates
+    ordinal = datum.dt.to_period('M').array.asi8
+    missing = datum.isna().to_numpy()
+    key = (ordinal // 12 + 1970) * 100 + ordinal % 12 + 1
+    key[missing] = 0
+    return pd.Series(key.astype('int32'), index=datum.index, name='date_key')
+
+
+def build_calendar(keys):
+    # One row per distinct date_key, in key order
+    keys = np.unique(np.asarray(keys, dtype='int32'))
+    missing = keys == 0
+    year = keys // 100
+    month = keys % 100
+    ordinal = (year.astype('int64') - 1970) * 12 + month - 1
+    ordinal[missing] = pd.NaT.value
+    parts = {'year': year, 'month': month, 'quarter': (month + 2) // 3}
+    if missing.any():
+        # Missing dates have no year, month or quarter (like the date parts of NaT), so groupbys leave them out
+        parts = {col: pd.arrays.IntegerArray(values.astype('int64'), missing) for col, values in parts.items()}
+    calendar = pd.DataFrame(dict(parts, month_year=pd.arrays.PeriodArray(ordinal, dtype=pd.PeriodDtype('M'))),
+                            index=pd.Index(keys, name='date_key'))
+    return calendar
+
+
+def with_calendar(frame, columns=DATE_PARTS):
+    # Calendar attributes of an aggregated frame that has a date_key column. Rows of missing dates (key 0) have
+    # no place on a time axis and are left out.
+    frame = frame[frame['date_key'] != 0]
+    calendar = build_calendar(frame['date_key'].unique())
+    return frame.join(calendar[columns], on='date_key')
+
+
+def split_fact(frame):
+    # (fact, details) of a merged frame with a date_key column
+    fact_columns = [col for col in frame.columns if col in FACT_COLUMNS]
+    return frame[fact_columns], frame.drop(columns=fact_columns)
+
+# --- CUBE ---
+
+def build_cube(dataset, dims):
+    # Measure sums and row count of every distinct combination of `dims`, as a fact table over the same dimensions.
+    # The filter index codes of the dimensions are combined into one integer key, factorized once and summed
+    # with bincount.
+    key = np.zeros(len(dataset), dtype='int64')
+    sizes = []
+    for col in dims:
+        postings = dataset.index.postings(col)
+        key = key * len(postings.counts) + postings.codes
+        sizes.append(len(postings.counts))
+    inverse, cells = pd.factorize(key, sort=True)
+
+    columns = {}
+    for col, size in reversed(list(zip(dims, sizes))):
+        codes = cells % size
+        cells = cells // size
+        s = dataset.fact[col]
+        if col == 'date_key':
+            columns[col] = dataset.calendar.index.to_numpy()[codes]
+        elif col == 'kat_kod':
+            columns[col] = pd.Categorical.from_codes(codes, dtype=s.dtype)
+        elif isinstance(s.dtype, pd.CategoricalDtype):
+            columns[col] = pd.Categorical.from_codes(codes - 1, dtype=s.dtype)
+        else:
+            values = dataset.index.postings(col).values.to_numpy()
+            column = values[np.maximum(codes - 1, 0)]
+            columns[col] = column if (codes > 0).all() else np.where(codes > 0, column, np.nan)
+    cube = pd.DataFrame({col: columns[col] for col in dims})
+
+    for col in CUBE_MEASURES:
+        values = dataset.fact[col].to_numpy()
+        sums = np.bincount(inverse, weights=np.nan_to_num(values.astype('float64')), minlength=len(cube))
+        cube[col] = sums.astype(values.dtype) if values.dtype.kind in 'iu' else sums
+    cube['rows'] = np.bincount(inverse, minlength=len(cube))
+    return cube
+
+
+class Dataset:
+    # Slim fact table plus the dimensions it references: the category dimension through the kat_kod codes
+    # (row i of `categories` belongs to code i of the categorical fact['kat_kod'] column) and the calendar
+    # through the integer date_key. Datasets built on the same fact table share its filter index and cube.
+    # The descriptive columns are in `details` (same rows as the fact table), `order` is the column order of the
+    # data view.
+
+    def __init__(self, fact, categories, calendar=None, index=None, cube=None, details=None, order=None):
+        self.fact = fact
+        self.details = details
+        self.order = order
+        self.categories = categories
+        self.calendar = build_calendar(fact['date_key'].unique()) if calendar is None else calendar
+        self.index = FilterIndex(fact, self.calendar) if index is None else index
+        # Key of results derived from this dataset, e.g. cached filtered views
+        self.version = next(_versions)
+        self._distinct = {}
+        self._adjacency = {}
+        # Pre-aggregated fact table (see build_cube) and the dataset over it
+        self.cube_fact = cube
+        self._cube = None
+
+    @property
+    def empty(self):
+        return self.fact.empty
+
+    def __len__(self):
+        return len(self.fact)
+
+    @property
+    def cube(self):
+        # The cube as a Dataset over the same dimensions, None before prepare()
+        if self._cube is None and self.cube_fact is not None:
+            self._cube = Dataset(self.cube_fact, self.categories, self.calendar)
+        return self._cube
+
+    def category_codes(self, fact=None):
+        fact = self.fact if fact is None else fact
+        return fact['kat_kod'].cat.codes.to_numpy()
+
+    @property
+    def calendar_rows(self):
+        # Calendar row of every fact row, kept with the date_key postings
+        return self.index.postings('date_key').codes
+
+    def distinct(self, col):
+        # Sorted distinct values of a filter column (the options of its widget), computed once per dataset
+        values = self._distinct.get(col)
+        if values is None:
+            if col in HIERARCHY:
+                values = sorted(self.categories[col].unique())
+            elif col == 'kat_kod':
+                values = sorted(self.categories.index)
+            elif col in DATE_PARTS:
+                # Missing dates (key 0) are no option
+                known = self.calendar.loc[self.calendar.index != 0, col]
+                values = sorted(known.unique() if col == 'month_year' else known.astype('int64').unique())
+            else:
+                values = self.index.distinct(col)
+            self._distinct[col] = values
+        return list(values)
+
+    def children(self, col, parents):
+        # Sorted values of hierarchy level `col` below the given values of the level above it (alkategoria under
+        # kategoria, elem under alkategoria), from an adjacency of the category dimension built once per dataset
+        adjacency = self._adjacency.get(col)
+        if adjacency is None:
+            parent = HIERARCHY[HIERARCHY.index(col) - 1]
+            adjacency = {}
+            for key, child in zip(self.categories[parent], self.categories[col]):
+                adjacency.setdefault(key, set()).add(child)
+            self._adjacency[col] = adjacency
+        return sorted(set().union(*(adjacency.get(key, ()) for key in parents)))
+
+    def prepare(self, columns=None):
+        # Filter index, widget options, category adjacency and cube of the filter columns, built once after the merge
+        columns = [col for col in FILTER_COLUMNS if col in self.fact.columns] if columns is None else columns
+        self.index.build(columns)
+        for col in HIERARCHY + ['kat_kod'] + RESOLVED_DATE_PARTS + [col for col in columns if col not in ['kat_kod', 'date_key']]:
+            self.distinct(col)
+        for col in HIERARCHY[1:]:
+            self.children(col, [])
+        if all(col in self.fact.columns for col in CUBE_MEASURES):
+            self.cube_fact = build_cube(self, columns)
+            self._cube = None
+
+    def hierarchy(self, col, codes):
+        # Dimension attribute of the given kat_kod codes, as a categorical
+        dim = self.categories[col].array
+        return pd.Categorical.from_codes(dim.codes[codes], dtype=dim.dtype)
+
+    def resolve(self, rows=None, columns=HIERARCHY, dates=RESOLVED_DATE_PARTS, details=False):
+        # Fact rows with the requested hierarchy and calendar attributes looked up in the dimensions,
+        # with `details` also the descriptive columns of the side table (for showing the rows)
+        fact = self.fact if rows is None else self.fact[rows]
+        calendar_rows = self.calendar_rows if rows is None else self.calendar_rows[rows]
+        codes = self.category_codes(fact)
+        if details and self.details is not None:
+            side = self.details if rows is None else self.details[rows]
+            fact = pd.concat([fact, side], axis=1)
+            if self.order is not None:
+                fact = fact[[col for col in self.order if col in fact.columns]]
+        view = fact.copy(deep=False)
+        for col in columns:
+            view[col] = self.hierarchy(col, codes)
+        for col in dates:
+            view[col] = self.calendar[col].array.take(calendar_rows)
+        return view
+
+    def filter_predicates(self, filters):
+        # filters: column -> accepted values, turned into accepted value codes per indexed column.
+        # Hierarchy, kat_kod and date part predicates are evaluated on the few hundred dimension rows.
+        dim_ok = np.ones(len(self.categories), dtype=bool)
+        calendar_ok = np.ones(len(self.calendar), dtype=bool)
+        predicates = {}
+        for col, values in filters.items():
+            if col in HIERARCHY:
+                dim_ok &= self.categories[col].isin(values).to_numpy()
+            elif col == 'kat_kod':
+                dim_ok &= self.categories.index.isin(values)
+            elif col in DATE_PARTS:
+                calendar_ok &= self.calendar[col].isin(values).to_numpy()
+            elif col in predicates:
+                predicates[col] &= self.index.accepted(col, values)
+            else:
+                predicates[col] = self.index.accepted(col, values)
+        predicates['kat_kod'] = dim_ok
+        predicates['date_key'] = calendar_ok
+        return predicates
+
+    def filter_plan(self, filters):
+        # Evaluation plan of the filters for debugging, one row per predicate (see FilterIndex.plan)
+        plan = self.index.plan(self.filter_predicates(filters))
+        return pd.DataFrame(plan, columns=['step', 'column', 'rows'])
+
+    def filter_mask(self, filters, exclude=False):
+        # Predicates accepting every row are dropped, the rest are answered from the filter index
+        mask = self.index.mask(self.filter_predicates(filters))
+        # 'Kivéve' keeps the rows failing at least one predicate
+        return ~mask if exclude else mask
+
+    def select(self, filters, exclude=False, columns=HIERARCHY, dates=RESOLVED_DATE_PARTS, details=False):
+        return self.resolve(self.filter_mask(filters, exclude), columns, dates, details)
+
+    def memory_usage(self):
+        return int(self.fact.memory_usage(deep=True).sum() + self.categories.memory_usage(deep=True).sum()
+                   + (0 if self.details is None else self.details.memory_usage(deep=True).sum())
+                   + self.calendar.memory_usage(deep=True).sum() + self.index.nbytes()
+                   + (0 if self.cube_fact is None else self.cube_fact.memory_usage(deep=True).sum()))
@@ -0,0 +1,251 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.indexing import DEBUG_FILTERS
+
+# --- FILTER SPEC ---
+
+class FilterSpec:
+    # Normalized, hashable filter state: the non-empty selections per column in a canonical order plus the mode.
+    # An empty multiselect means every value, so it is left out instead of being filled with all options.
+    __slots__ = ('filters', 'exclude')
+
+    def __init__(self, filters=None, exclude=False):
+        filters = filters or {}
+        self.filters = tuple(sorted((col, _canonical(values)) for col, values in filters.items() if len(values)))
+        self.exclude = bool(exclude)
+
+    def as_dict(self):
+        return {col: list(values) for col, values in self.filters}
+
+    def __eq__(self, other):
+        return isinstance(other, FilterSpec) and (self.filters, self.exclude) == (other.filters, other.exclude)
+
+    def __hash__(self):
+        return hash((self.filters, self.exclude))
+
+    def __repr__(self):
+        return f'FilterSpec({self.as_dict()!r}, exclude={self.exclude})'
+
+
+def _canonical(values):
+    # Distinct values in a stable order, missing values (NaN / None) as None
+    values = {None if pd.isna(value) else value for value in values}
+    return tuple(sorted(values, key=lambda value: (value is None, repr(value))))
+
+
+def filter_mask(dataset, spec):
+    # Read-only, shared by every session filtering the same dataset the same way
+    return get_filter_cache().get((dataset.version, spec, 'mask'), dataset,
+                                  lambda: _read_only(dataset.filter_mask(spec.as_dict(), spec.exclude)))
+
+
+def select(dataset, spec):
+    # Filtered rows with the hierarchy, date parts and descriptive columns, for showing the rows. The cached view
+    # is never handed out itself, the shallow copy lets pages add columns to it.
+    view = get_filter_cache().get((dataset.version, spec, 'view'), dataset,
+                                  lambda: dataset.resolve(filter_mask(dataset, spec), details=True))
+    return view.copy(deep=False)
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+def show_plan(dataset, spec, label='Szűrési terv'):
+    # Evaluation plan of the filters, only shown with DRAGON_DEBUG_FILTERS=1
+    if DEBUG_FILTERS:
+        with st.expander(label):
+            st.dataframe(dataset.filter_plan(spec.as_dict()), hide_index=True)
+
+# --- FILTERED RESULT CACHE ---
+
+# Size cap of the cached filter masks and filtered views of the process
+FILTER_CACHE_BYTES = int(os.environ.get('DRAGON_FILTER_CACHE_MB', 256)) * 1024 ** 2
+
+
+def _nbytes(value):
+    # Own memory of a cached value; a view shares the text objects of its fact table, so only the column arrays count
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return int(value.memory_usage(index=True, deep=False).sum())
+
+
+class FilterCache:
+    # Least recently used results keyed by (dataset version, FilterSpec, kind), dropped over the size cap
+    # and together with their dataset.
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._tracked = set()
+        self._lock = threading.Lock()
+
+    def get(self, key, dataset, build):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0]
+        value = build()
+        nbytes = _nbytes(value)
+        if nbytes > self.max_bytes:
+            return value
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, nbytes)
+                self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self._nbytes -= dropped
+            if dataset.version not in self._tracked:
+                self._tracked.add(dataset.version)
+                weakref.finalize(dataset, self.discard, dataset.version)
+        return value
+
+    def discard(self, version):
+        with self._lock:
+            self._tracked.discard(version)
+            for key in [key for key in self._entries if key[0] == version]:
+                self._nbytes -= self._entries.pop(key)[1]
+
+    def nbytes(self):
+        with self._lock:
+            return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@st.cache_resource
+def get_filter_cache():
+    return FilterCache(FILTER_CACHE_BYTES)
+
+# --- FILTER PANEL ---
+
+QUARTER_MAPPING = {'Q1': 1, 'Q2': 2, 'Q3': 3, 'Q4': 4}
+
+MONTHS_IN_QUARTER = {
+    1: [1, 2, 3],
+    2: [4, 5, 6],
+    3: [7, 8, 9],
+    4: [10, 11, 12]}
+
+MONTH_NAMES = {1: 'Január', 2: 'Február', 3: 'Március', 4: 'Április', 5: 'Május', 6: 'Június', 7: 'Július', 8: 'Augusztus', 9: 'Szeptember', 10: 'Október', 11: 'November', 12: 'December'}
+
+# Filter columns in widget order (the category levels narrow each other), with label and placeholder
+FILTER_WIDGETS = {
+    'year': ('Tárgyév', 'Válassz évet'),
+    'quarter': ('Negyedév', 'Válassz negyedévet'),
+    'month': ('Hónap', 'Válassz hónapot'),
+    'kategoria': ('Kategória', 'Válassz kategóriát'),
+    'alkategoria': ('Alkategória', 'Válassz alkategóriát'),
+    'elem': ('Kategória elem', 'Válassz kategória elemet'),
+    'fo_kat': ('Fő kategória', 'Válassz fő kategóriát'),
+    'kat_kod': ('Kategória kód', 'Válassz kategória kódot'),
+    'partner': ('Partner', 'Válassz partnert')}
+
+FILTER_HELP = {'fo_kat': 'A 0. kategória a nem besorolt!'}
+
+FILTER_MODES = ['Tartalmazza', 'Kivéve']
+
+MODE_HELP = 'Kivéve esetén ha nincs megadott feltétel, akkor nem jelenik meg adat! Először adja meg a kivételt, utána álltsa a mezőt Kivéve értékre!'
+
+
+def filter_options(dataset, col, selected=None):
+    # Options of a filter widget, read from the distinct values stored with the dataset; alkategoria and elem
+    # only offer the children of the selected parent level, months only the months of the selected quarters
+    selected = selected or {}
+    if col == 'month':
+        quarters = selected.get('quarter') or dataset.distinct('quarter')
+        months = sorted({month for q in quarters for month in MONTHS_IN_QUARTER.get(q, [])})
+        return [MONTH_NAMES[month] for month in months]
+    if col in ['alkategoria', 'elem']:
+        parent = 'kategoria' if col == 'alkategoria' else 'alkategoria'
+        if selected.get(parent):
+            return dataset.children(col, selected[parent])
+    return dataset.distinct(col)
+
+
+def filter_panel(dataset, containers, prefix=''):
+    # Filter widgets of a page, each in its container (filter column -> container, 'mode' for the
+    # Tartalmazza / Kivéve selectbox). `prefix` tells apart the panels of one page ('Bevétel', 'Kiadás').
+    def label(text):
+        return f'{prefix} {text.lower()}' if prefix else text
+
+    selected = {}
+    for col, (text, placeholder) in FILTER_WIDGETS.items():
+        if col not in containers:
+            continue
+        options = QUARTER_MAPPING if col == 'quarter' else filter_options(dataset, col, selected)
+        values = containers[col].multiselect(label(text), options=options, placeholder=placeholder, help=FILTER_HELP.get(col))
+        if col == 'quarter':
+            values = [QUARTER_MAPPING[q] for q in values]
+        elif col == 'month':
+            values = [k for k, v in MONTH_NAMES.items() if v in values]
+        selected[col] = values
+
+    mode = containers['mode'].selectbox(label('Szűrés típusa'), options=FILTER_MODES, help=MODE_HELP)
+    return FilterSpec(selected, mode == 'Kivéve')
+
+
+def filter_values(dataset, spec, col):
+    # Values of `col` the filters let through: the selection, or every option when nothing is selected
+    values = dict(spec.filters).get(col)
+    return sorted(values) if values else filter_options(dataset, col)
+
+# --- STAGED FILTERS ---
+
+BATCH_HELP = 'Bekapcsolva a szűrési feltételek módosítása csak a Szűrés alkalmazása gombra frissíti az oldalt, így több feltétel is beállítható egy újraszámolással.'
+
+
+def staged_filter_panel(dataset, layout, key, prefix=''):
+    # filter_panel in a fragment: editing a filter only reruns the filter widgets (the cascading options stay up
+    # to date) and the page is recomputed once, when the edits are applied. `layout()` creates the containers
+    # of filter_panel plus an 'apply' container for the batching controls. Returns the applied FilterSpec.
+    applied = f'{key}_applied'
+    if applied not in st.session_state:
+        st.session_state[applied] = FilterSpec()
+    # Within a page run the fragment's edits are picked up below, only a rerun of the fragment alone has to
+    # rerun the page
+    st.session_state[f'{key}_page_run'] = True
+    try:
+        _staged_filters(dataset, layout, key, prefix)
+    finally:
+        st.session_state[f'{key}_page_run'] = False
+    return st.session_state[applied]
+
+
+def pending_changes(staged, applied):
+    # Labels of the filters whose staged selection differs from the applied one
+    staged_filters, applied_filters = dict(staged.filters), dict(applied.filters)
+    changed = [text for col, (text, _) in FILTER_WIDGETS.items() if staged_filters.get(col) != applied_filters.get(col)]
+    if staged.exclude != applied.exclude:
+        changed.append('Szűrés típusa')
+    return changed
+
+
+@st.fragment
+def _staged_filters(dataset, layout, key, prefix):
+    containers = layout()
+    staged = filter_panel(dataset, containers, prefix)
+    changed = pending_changes(staged, st.session_state[f'{key}_applied'])
+
+    with containers['apply']:
+        batched = st.toggle('Szűrés gombnyomásra', value=True, key=f'{key}_batched', help=BATCH_HELP)
+        apply = batched and st.button('Szűrés alkalmazása', key=f'{key}_apply', type='primary', disabled=not changed)
+
+        if changed and (apply or not batched):
+            st.session_state[f'{key}_applied'] = staged
+            if not st.session_state[f'{key}_page_run']:
+                st.rerun()
+        elif changed:
+            st.warning(f"Nem alkalmazott módosítások: {', '.join(changed)}", icon='⏳')
@@ -0,0 +1,158 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# --- INVERTED INDEX ---
+
+# Predicates selecting more than this share of the rows are applied through the rows they reject
+BROAD_SHARE = 0.5
+
+# Show the evaluation plan of the page filters (DRAGON_DEBUG_FILTERS=1)
+DEBUG_FILTERS = os.environ.get('DRAGON_DEBUG_FILTERS', '') == '1'
+
+
+class Postings:
+    # Row ids of one column grouped by value code: rows[offsets[v]:offsets[v + 1]] hold the rows of value v.
+    # `values` are the sorted distinct values behind the codes of plain (not categorical) columns.
+
+    def __init__(self, codes, size, values=None):
+        self.values = values
+        # 16 bit codes keep the index small and let numpy sort them with a radix sort
+        self.codes = codes.astype('int16' if size <= np.iinfo('int16').max else 'int32')
+        self.counts = np.bincount(self.codes, minlength=size)
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+        self.rows = np.argsort(self.codes, kind='stable').astype('int32')
+
+    def count(self, accepted):
+        return int(self.counts[accepted].sum())
+
+    def rows_of(self, accepted):
+        values = np.flatnonzero(accepted)
+        if len(values) == 0:
+            return np.empty(0, dtype='int32')
+        return np.concatenate([self.rows[self.offsets[v]:self.offsets[v + 1]] for v in values])
+
+    def nbytes(self):
+        return self.codes.nbytes + self.counts.nbytes + self.offsets.nbytes + self.rows.nbytes
+
+
+class FilterIndex:
+    # Value -> rows index of the filterable fact columns, built once per column and shared by every filter.
+    # kat_kod is keyed by category dimension row, date_key by calendar row; other columns get a leading
+    # value code 0 for missing cells.
+
+    def __init__(self, fact, calendar):
+        self.fact = fact
+        self.calendar = calendar
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.fact)
+
+    def postings(self, col):
+        with self._lock:
+            postings = self._postings.get(col)
+        if postings is not None:
+            return postings
+
+        s = self.fact[col]
+        values = None
+        if col == 'date_key':
+            codes = np.searchsorted(self.calendar.index.to_numpy(), s.to_numpy()).astype('int32')
+            size = len(self.calendar)
+        elif col == 'kat_kod':
+            codes = s.cat.codes.to_numpy().astype('int32')
+            size = len(s.cat.categories)
+        elif isinstance(s.dtype, pd.CategoricalDtype):
+            codes = s.cat.codes.to_numpy().astype('int32') + 1
+            size = len(s.cat.categories) + 1
+        else:
+            codes, values = pd.factorize(s, sort=True)
+            codes = codes.astype('int32') + 1
+            size = len(values) + 1
+        postings = Postings(codes, size, values)
+
+        with self._lock:
+            return self._postings.setdefault(col, postings)
+
+    def distinct(self, col):
+        # Sorted distinct values of a plain fact column, read from its postings; a missing value comes last
+        postings = self.postings(col)
+        s = self.fact[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            values = s.cat.categories.to_numpy()[postings.counts[1:] > 0]
+        else:
+            values = postings.values.to_numpy()
+        values = sorted(values)
+        if postings.counts[0] > 0:
+            values.append(np.nan)
+        return values
+
+    def build(self, columns):
+        for col in columns:
+            self.postings(col)
+
+    def accepted(self, col, values):
+        # Accepted value codes of a plain fact column, as a boolean array over its postings
+        s = self.fact[col]
+        values = list(values)
+        missing = any(pd.isna(value) for value in values)
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            known = s.cat.categories.isin(values)
+        else:
+            known = np.isin(self.postings(col).values, values)
+        return np.concatenate([[missing], known])
+
+    def plan(self, predicates):
+        # predicates: column -> accepted value codes. Evaluation order as (step, column, matching rows) tuples:
+        # 'skip' a predicate accepting every row, 'empty' when one accepts none, 'expand' the narrowest predicate
+        # through its postings and 'check' the others on those rows only, or, when every predicate is broad,
+        # 'clear' the rows each one rejects.
+        n = len(self.fact)
+        steps = []
+        active = []
+        for col, accepted in predicates.items():
+            selected = self.postings(col).count(accepted)
+            if selected == n:
+                steps.append(('skip', col, selected))
+            elif selected == 0:
+                return steps + [('empty', col, 0)]
+            else:
+                active.append((selected, col))
+        active.sort()
+        if active and active[0][0] <= n * BROAD_SHARE:
+            steps.append(('expand', active[0][1], active[0][0]))
+            steps += [('check', col, selected) for selected, col in active[1:]]
+        else:
+            steps += [('clear', col, selected) for selected, col in active]
+        return steps
+
+    def mask(self, predicates, plan=None):
+        # Rows matching all predicates, as a boolean mask
+        n = len(self.fact)
+        plan = self.plan(predicates) if plan is None else plan
+        rows = None
+        mask = None
+        for step, col, _ in plan:
+            postings = self.postings(col)
+            accepted = predicates[col]
+            if step == 'empty':
+                return np.zeros(n, dtype=bool)
+            elif step == 'expand':
+                rows = postings.rows_of(accepted)
+            elif step == 'check':
+                rows = rows[accepted[postings.codes[rows]]]
+            elif step == 'clear':
+                mask = np.ones(n, dtype=bool) if mask is None else mask
+                mask[postings.rows_of(~accepted)] = False
+        if rows is not None:
+            mask = np.zeros(n, dtype=bool)
+            mask[rows] = True
+        return np.ones(n, dtype=bool) if mask is None else mask
+
+    def nbytes(self):
+        with self._lock:
+            return sum(postings.nbytes() for postings in self._postings.values())
@@ -0,0 +1,435 @@
+import csv
+import hashlib
+import importlib.util
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import streamlit as st
+
+# --- TEMPLATE SCHEMAS ---
+
+# Column name -> parsed type of every upload template, in template order
+INC_DATA_SCHEMA = {
+    'partner': 'object',
+    'datum': 'datetime',
+    'egyseg_ar': 'float',
+    'deviza': 'object',
+    'mennyiseg': 'float',
+    'teljes_ar': 'float',
+    'teljes_forintban': 'float',
+    'EUR_HUF': 'float',
+    'kat_kod': 'object'}
+
+EXP_DATA_SCHEMA = {
+    'ID': 'object',
+    'partner': 'object',
+    'bizonylat_szam': 'object',
+    'megjegyzes': 'object',
+    'datum': 'datetime',
+    'netto': 'float',
+    'kat_kod': 'object',
+    'fo_kat': 'object',
+    'forras': 'object'}
+
+INC_CAT_SCHEMA = {
+    'kategoria': 'object',
+    'alkategoria': 'object',
+    'elem': 'object',
+    'kat_kod': 'object'}
+
+EXP_CAT_SCHEMA = dict(INC_CAT_SCHEMA)
+
+EMPLOYEES_SCHEMA = {
+    'datum': 'datetime',
+    'vam': 'float',
+    'penzugy': 'float',
+    'egyeb': 'float',
+    'osszes': 'float'}
+
+# --- PARSE CACHE ---
+
+# Upper bound for the parsed frames kept in memory by the whole server process
+PARSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ParseCache:
+    # LRU cache of parsed uploads, keyed by (content hash, expected columns)
+
+    def __init__(self, max_bytes=PARSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            df, stats, _ = self._entries[key]
+            return df, stats
+
+    def put(self, key, df, stats=None):
+        # The size is measured once and kept in the statistics, the session budget reuses it
+        nbytes = 0 if df is None else int(df.memory_usage(deep=True).sum())
+        if stats is not None:
+            stats['nbytes'] = nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[2]
+            self._entries[key] = (df, stats, nbytes)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def discard(self, content_hash):
+        # Drops every parse of one file, whatever columns it was parsed for
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == content_hash]:
+                self.size -= self._entries.pop(key)[2]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@st.cache_resource
+def get_parse_cache():
+    return ParseCache()
+
+
+def release_parsed(content_hash):
+    # Called once the session no longer needs the raw rows of an upload, so they don't stay resident in the cache
+    get_parse_cache().discard(content_hash)
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+# --- HEADER VALIDATION ---
+
+def read_header(data):
+    # Reads only the first row of the first worksheet, the rest of the sheet is never parsed
+    wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        first_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+    finally:
+        wb.close()
+
+    header = list(first_row)
+    while header and header[-1] is None:
+        header.pop()
+    # Same naming as pd.read_excel for empty header cells
+    return [f'Unnamed: {i}' if name is None else name for i, name in enumerate(header)]
+
+
+def read_csv_header(data):
+    first_line = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig').readline()
+    return next(csv.reader([first_line], delimiter=csv_delimiter(first_line)), [])
+
+
+def read_parquet_header(data):
+    # Only the file footer is read, no row group is decoded
+    import pyarrow.parquet as pq
+    return pq.read_schema(io.BytesIO(data)).names
+
+
+def header_matches(data, columns, fmt='xlsx'):
+    readers = {'xlsx': read_header, 'csv': read_csv_header, 'parquet': read_parquet_header}
+    try:
+        return readers[fmt](data) == list(columns)
+    except Exception:
+        return False
+
+# --- STREAMING READER ---
+
+# Rows per column chunk of the streaming reader
+CHUNK_ROWS = 50_000
+
+_ALLOWED_TYPES = {
+    'float': {'floating', 'integer', 'mixed-integer-float', 'decimal', 'empty'},
+    'datetime': {'datetime', 'datetime64', 'date', 'empty'},
+}
+
+
+def _rss_bytes():
+    # Resident set size of the server process, sampled between chunks (Linux only, 0 elsewhere)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _peak_rss_bytes():
+    # Peak resident set size of the process since the last reset (VmHWM, Linux only, 0 elsewhere)
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+class PeakMemory:
+    # Peak memory growth while a parser runs. The kernel's high-water mark is reset first, so one-shot parsers
+    # (calamine, pd.read_excel, CSV, Parquet) are measured as exactly as the chunked stream reader. Where it can't
+    # be reset the growth between start and end is kept, unless the parser sampled its own peak.
+
+    def __enter__(self):
+        self.start = _rss_bytes()
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            self.exact = _peak_rss_bytes() > 0
+        except OSError:
+            self.exact = False
+        return self
+
+    def __exit__(self, *exc):
+        self.end = _peak_rss_bytes() if self.exact else _rss_bytes()
+        return False
+
+    def record(self, stats):
+        if self.start and self.end and (self.exact or 'peak_mb' not in stats):
+            stats['peak_mb'] = max(self.end - self.start, 0) / 1024 ** 2
+
+
+def _typed_chunk(values, kind):
+    # One fixed-size chunk of a column, numeric and date columns never go through an object array
+    if kind == 'object':
+        chunk = np.empty(len(values), dtype=object)
+        chunk[:] = values
+        return chunk
+    if pd.api.types.infer_dtype(values, skipna=True) not in _ALLOWED_TYPES[kind]:
+        raise ValueError(f'Unexpected cell type for a {kind} column')
+    if kind == 'float':
+        return np.array(values, dtype='float64')
+    return np.array(values, dtype='datetime64[ns]')
+
+
+def stream_xlsx(data, schema, chunk_rows=CHUNK_ROWS, progress=None):
+    # Iterates the first worksheet row by row in read-only mode and fills typed column chunks.
+    # Returns the assembled frame and the parse statistics.
+    columns = list(schema)
+    width = len(columns)
+
+    start = time.perf_counter()
+    start_rss = peak_rss = _rss_bytes()
+
+    wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        total_rows = max((ws.max_row or 1) - 1, 1)
+        chunks = {col: [] for col in columns}
+        buffer = []
+        rows = 0
+
+        def flush():
+            nonlocal peak_rss
+            for col, values in zip(columns, zip(*buffer)):
+                chunks[col].append(_typed_chunk(values, schema[col]))
+            peak_rss = max(peak_rss, _rss_bytes())
+            buffer.clear()
+            if progress is not None:
+                progress(min(rows / total_rows, 1.0))
+
+        for row in ws.iter_rows(min_row=2, max_col=width, values_only=True):
+            if all(value is None for value in row):
+                continue
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            buffer.append(row)
+            rows += 1
+            if len(buffer) == chunk_rows:
+                flush()
+        if buffer:
+            flush()
+    finally:
+        wb.close()
+
+    empty = {'object': object, 'float': 'float64', 'datetime': 'datetime64[ns]'}
+    df = pd.DataFrame({
+        col: np.concatenate(chunks[col]) if chunks[col] else np.empty(0, dtype=empty[schema[col]])
+        for col in columns}, copy=False)
+
+    seconds = time.perf_counter() - start
+    peak_rss = max(peak_rss, _rss_bytes())
+
+    stats = {
+        'engine': 'openpyxl-stream',
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds if seconds else 0.0,
+    }
+    if start_rss:
+        stats['peak_mb'] = (peak_rss - start_rss) / 1024 ** 2
+    return df, stats
+
+# --- READER BACKENDS ---
+
+def _read_calamine(data, schema, progress):
+    return pd.read_excel(io.BytesIO(data), engine='calamine'), {}
+
+
+def _read_stream(data, schema, progress):
+    df, stats = stream_xlsx(data, schema, progress=progress)
+    return df, {key: stats[key] for key in ('peak_mb',) if key in stats}
+
+
+def _read_openpyxl(data, schema, progress):
+    return pd.read_excel(io.BytesIO(data), engine='openpyxl'), {}
+
+
+# Fastest first; a backend whose package is missing is skipped, one that fails on the file falls through to the next
+READERS = [
+    ('calamine', 'python_calamine', _read_calamine),
+    ('openpyxl-stream', 'openpyxl', _read_stream),
+    ('openpyxl', 'openpyxl', _read_openpyxl),
+]
+
+
+def available_readers():
+    return [(name, reader) for name, package, reader in READERS if importlib.util.find_spec(package) is not None]
+
+
+def read_workbook(data, schema, progress=None):
+    # Parses with the fastest backend that works and records which one it was, how long it took and its peak
+    # memory. Only the stream reader reports progress per chunk, the others at their start and end.
+    error = None
+    for name, reader in available_readers():
+        if progress is not None:
+            progress(0.0)
+        start = time.perf_counter()
+        try:
+            with PeakMemory() as peak:
+                df, extra = reader(data, schema, progress)
+        except Exception as e:
+            error = e
+            continue
+        seconds = time.perf_counter() - start
+        stats = {'engine': name, 'rows': len(df), 'seconds': seconds,
+                 'rows_per_sec': len(df) / seconds if seconds else 0.0}
+        stats.update(extra)
+        peak.record(stats)
+        if progress is not None:
+            progress(1.0)
+        return df, stats
+    if error is None:
+        error = ImportError('Reading .xlsx files needs python_calamine or openpyxl')
+    raise error
+
+# --- CSV AND PARQUET ---
+
+# File extensions accepted by the uploaders
+UPLOAD_TYPES = ['xlsx', 'csv', 'parquet']
+
+
+def upload_format(file_name):
+    extension = file_name.rsplit('.', 1)[-1].lower()
+    return extension if extension in UPLOAD_TYPES else 'xlsx'
+
+
+def csv_delimiter(header_line):
+    return max([',', ';', '\t'], key=header_line.count)
+
+
+def read_csv_typed(data, schema):
+    # Every column gets an explicit dtype, nothing is left to per-row type inference
+    delimiter = csv_delimiter(io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig').readline())
+    # Semicolon separated exports use decimal commas, the pyarrow parser only handles decimal points
+    if delimiter != ';' and importlib.util.find_spec('pyarrow') is not None:
+        df, engine = _read_csv_pyarrow(data, schema, delimiter), 'pyarrow'
+    else:
+        dtype = {col: 'float64' if kind == 'float' else str for col, kind in schema.items()}
+        df = pd.read_csv(io.BytesIO(data), sep=delimiter, dtype=dtype, encoding='utf-8-sig', engine='c',
+                         decimal=',' if delimiter == ';' else '.')
+        engine = 'c'
+    # Dates are read as text, an empty or unreadable cell becomes NaT like in the workbooks
+    for col, kind in schema.items():
+        if kind == 'datetime':
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df, {'engine': f'csv-{engine}'}
+
+
+def _read_csv_pyarrow(data, schema, delimiter):
+    # The column types are given to the parser itself: pandas would only cast after pyarrow's own inference,
+    # which turns '0077' into '77.0' and empty text cells into 'None'. Empty cells stay missing (None / NaN).
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    types = {col: pa.float64() if kind == 'float' else pa.string() for col, kind in schema.items()}
+    table = pa_csv.read_csv(
+        io.BytesIO(data),
+        parse_options=pa_csv.ParseOptions(delimiter=delimiter),
+        convert_options=pa_csv.ConvertOptions(column_types=types, strings_can_be_null=True))
+    return table.to_pandas()
+
+
+def read_parquet(data, schema):
+    # Column-wise read of the template columns, the stored types are kept as they are
+    df = pd.read_parquet(io.BytesIO(data), columns=list(schema))
+    for col, kind in schema.items():
+        if kind == 'datetime' and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col])
+    return df, {'engine': 'parquet'}
+
+
+def read_upload_data(data, fmt, schema, progress=None):
+    if fmt == 'xlsx':
+        return read_workbook(data, schema, progress=progress)
+    if progress is not None:
+        progress(0.0)
+    start = time.perf_counter()
+    with PeakMemory() as peak:
+        if fmt == 'csv':
+            df, stats = read_csv_typed(data, schema)
+        else:
+            df, stats = read_parquet(data, schema)
+    seconds = time.perf_counter() - start
+    stats.update({'rows': len(df), 'seconds': seconds, 'rows_per_sec': len(df) / seconds if seconds else 0.0})
+    peak.record(stats)
+    if progress is not None:
+        progress(1.0)
+    return df, stats
+
+# --- UPLOAD ---
+
+def load_upload(uploaded_file, schema, progress=None):
+    # Returns (frame, parse statistics); the frame is None when the columns don't match the template.
+    # The same file is parsed only once per server process, every later rerun is a cache hit.
+    data = uploaded_file.getvalue()
+    key = (content_hash(data), tuple(schema))
+    cache = get_parse_cache()
+
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+
+    # A wrong file is rejected from its first row, the full parse only starts after the header matches
+    fmt = upload_format(uploaded_file.name)
+    if not header_matches(data, schema, fmt):
+        cache.put(key, None)
+        return None, None
+
+    df, stats = read_upload_data(data, fmt, schema, progress=progress)
+    stats['file'] = uploaded_file.name
+    stats['content_hash'] = key[0]
+    if df.columns.to_list() != list(schema):
+        df, stats = None, None
+    cache.put(key, df, stats)
+    return df, stats
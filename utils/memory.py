@@ -0,0 +1,49 @@
+import os
+
+import pandas as pd
+import streamlit as st
+
+from utils.dataset import Dataset
+from utils.registry import Handle, get_registry
+
+# --- SESSION MEMORY ---
+
+# Upper bound for the data one session may hold, shared entries count in full
+SESSION_MEMORY_BUDGET = int(os.environ.get('DRAGON_SESSION_BUDGET_MB', 1024)) * 1024 ** 2
+
+
+def value_nbytes(value):
+    if isinstance(value, Dataset):
+        return value.memory_usage()
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    return 0
+
+
+def session_usage():
+    # One row per frame held by the session: size and the number of sessions sharing it
+    registry = get_registry()
+    rows = []
+    for name in st.session_state:
+        value = st.session_state[name]
+        if isinstance(value, Handle):
+            rows.append({'name': name, 'bytes': registry.nbytes(value.key, value_nbytes),
+                         'sessions': registry.refcount(value.key)})
+        elif isinstance(value, (pd.DataFrame, Dataset)):
+            rows.append({'name': name, 'bytes': value_nbytes(value), 'sessions': 1})
+    return pd.DataFrame(rows, columns=['name', 'bytes', 'sessions'])
+
+
+def session_bytes():
+    return int(session_usage()['bytes'].sum())
+
+
+def fits_budget(value, replaces=None, nbytes=None):
+    # Whether the session stays within its budget after storing `value` (in place of `replaces`);
+    # `nbytes` is the size of `value` when it is already known, e.g. from the parse statistics
+    held = session_usage()
+    if replaces is not None:
+        held = held[held['name'] != replaces]
+    if nbytes is None:
+        nbytes = value_nbytes(value)
+    return held['bytes'].sum() + nbytes <= SESSION_MEMORY_BUDGET
@@ -0,0 +1,127 @@
+import threading
+import weakref
+
+import streamlit as st
+
+# --- SHARED DATASET REGISTRY ---
+
+class Handle:
+    # What a session keeps in st.session_state: the content key of a registry entry.
+    # The registry reference is released when the handle is garbage collected (replaced or session closed).
+    __slots__ = ('key', '__weakref__')
+
+    def __init__(self, key):
+        self.key = key
+
+    @property
+    def value(self):
+        # None once the entry is gone, e.g. after the resource cache was cleared or the server redeployed
+        return get_registry().get(self.key)
+
+    def __repr__(self):
+        return f'Handle({self.key!r})'
+
+
+class DatasetRegistry:
+    # Process-wide frames and datasets keyed by their content (upload hashes, inputs of the merge, store version).
+    # Identical content is held once however many sessions use it; an entry is dropped when no handle refers to it.
+    # Registered values are shared read-only: pages derive new frames from them and never modify them in place.
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def share(self, key, build):
+        # Handle to the entry of `key`; `build()` only runs when no session holds that content yet
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] += 1
+        if entry is None:
+            value = build()
+            with self._lock:
+                # value, reference count, size in bytes (measured on first request)
+                entry = self._entries.setdefault(key, [value, 0, None])
+                entry[1] += 1
+        handle = Handle(key)
+        weakref.finalize(handle, self.release, key)
+        return handle
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[0]
+
+    def nbytes(self, key, measure):
+        # Size of the entry, measured once with `measure(value)` and kept with the entry (0 for a missing entry)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return 0
+            value, nbytes = entry[0], entry[2]
+        if nbytes is None:
+            nbytes = measure(value)
+            with self._lock:
+                entry[2] = nbytes
+        return nbytes
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._entries[key]
+
+    def refcount(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return 0 if entry is None else entry[1]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@st.cache_resource
+def get_registry():
+    return DatasetRegistry()
+
+# --- SESSION ACCESS ---
+
+def put_shared(name, key, build):
+    # Stores a handle under `name`, the previous handle of the session (if any) is released with it
+    st.session_state[name] = get_registry().share(key, build)
+    return st.session_state[name].value
+
+
+def drop_shared(name):
+    # Releases the session's reference, the entry itself goes when no other session holds it
+    st.session_state.pop(name, None)
+
+
+def get_shared(name):
+    # None when the entry is gone from the registry, the stale handle is dropped with it
+    value = st.session_state[name].value
+    if value is None:
+        drop_shared(name)
+    return value
+
+
+def drop_stale():
+    # Drops the session's handles whose entry is gone (the registry is a cache resource, "Clear cache" or a
+    # redeploy empties it while sessions are alive), so pages treat that data as not uploaded.
+    # Returns the dropped names.
+    registry = get_registry()
+    stale = [name for name, value in st.session_state.items() if isinstance(value, Handle) and value.key not in registry]
+    for name in stale:
+        drop_shared(name)
+    return stale
+
+
+def shared_key(name):
+    return st.session_state[name].key
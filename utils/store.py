@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+import streamlit as st
+
+from utils.dataset import Dataset, split_fact
+from utils.registry import drop_stale, put_shared
+
+# --- PERSISTENT STORE ---
+
+# Root folder of the saved data, one subfolder per stored session variable
+STORE_DIR = os.environ.get('DRAGON_DATA_DIR', 'data')
+
+# Session variables that survive a page refresh
+STORED = ['df_income', 'df_expense', 'df_employees']
+
+# Number of upload versions kept per variable, older ones are deleted after a save
+KEEP_VERSIONS = 3
+
+
+def _write_parquet(df, path, index=False):
+    # Columnar file with dictionary encoded columns, categoricals come back as categoricals
+    df.to_parquet(path, engine='pyarrow', index=index, compression='zstd', use_dictionary=True)
+
+
+def _versions(name):
+    folder = os.path.join(STORE_DIR, name)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(entry for entry in os.listdir(folder) if not entry.startswith('.') and entry != 'CURRENT')
+
+
+def current_version(name):
+    try:
+        with open(os.path.join(STORE_DIR, name, 'CURRENT')) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def stored_key(name, version):
+    # Registry key the version was saved with, versions without one get a key of their own
+    try:
+        with open(os.path.join(STORE_DIR, name, version, 'key.json')) as f:
+            return tuple(json.load(f))
+    except (OSError, ValueError):
+        return (name, f'store-{version}')
+
+
+def save(name, value, key=None):
+    # Every save is a new version folder, CURRENT is switched only after all files are written.
+    # Saving the content of the current version again is a no-op.
+    current = current_version(name)
+    if key is not None and current is not None and stored_key(name, current) == tuple(key):
+        return current
+
+    # Seconds and microseconds of one clock reading, so the names sort in save order
+    now = time.time_ns()
+    version = time.strftime('%Y%m%d-%H%M%S', time.localtime(now // 1_000_000_000)) + f'-{now // 1000 % 1_000_000:06d}'
+    folder = os.path.join(STORE_DIR, name)
+    tmp = os.path.join(folder, '.' + version)
+    os.makedirs(tmp, exist_ok=True)
+
+    if isinstance(value, Dataset):
+        _write_parquet(value.fact, os.path.join(tmp, 'fact.parquet'))
+        _write_parquet(value.categories, os.path.join(tmp, 'categories.parquet'), index=True)
+        if value.details is not None:
+            _write_parquet(value.details, os.path.join(tmp, 'details.parquet'))
+            with open(os.path.join(tmp, 'columns.json'), 'w') as f:
+                json.dump(value.order, f)
+    else:
+        _write_parquet(value, os.path.join(tmp, 'frame.parquet'))
+    if key is not None:
+        with open(os.path.join(tmp, 'key.json'), 'w') as f:
+            json.dump(list(key), f)
+    os.replace(tmp, os.path.join(folder, version))
+
+    # The pointer is written through a temp file of this save, concurrent saves don't share it
+    pointer = os.path.join(folder, f'.CURRENT-{version}')
+    with open(pointer, 'w') as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(folder, 'CURRENT'))
+
+    # The version CURRENT points to is kept even if a concurrent save made it one of the older ones
+    keep = {version, current_version(name)}
+    for old in _versions(name)[:-KEEP_VERSIONS]:
+        if old not in keep:
+            shutil.rmtree(os.path.join(folder, old), ignore_errors=True)
+    return version
+
+
+def load_version(name, version):
+    folder = os.path.join(STORE_DIR, name, version)
+    if os.path.exists(os.path.join(folder, 'fact.parquet')):
+        fact = pd.read_parquet(os.path.join(folder, 'fact.parquet'))
+        categories = pd.read_parquet(os.path.join(folder, 'categories.parquet'))
+        if os.path.exists(os.path.join(folder, 'details.parquet')):
+            details = pd.read_parquet(os.path.join(folder, 'details.parquet'))
+            with open(os.path.join(folder, 'columns.json')) as f:
+                order = json.load(f)
+        else:
+            # Versions saved before the side table kept every column in the fact table
+            order = list(fact.columns)
+            fact, details = split_fact(fact)
+        dataset = Dataset(fact, categories, details=details, order=order)
+        dataset.prepare()
+        return dataset
+    return pd.read_parquet(os.path.join(folder, 'frame.parquet'))
+
+
+def restore_session():
+    # Fills the missing session variables from the latest saved versions once per session, e.g. after a page refresh.
+    # Sessions restoring the same version share one copy through the registry.
+    # Handles left over from an emptied registry are dropped first and the saved versions are restored again.
+    if drop_stale():
+        st.session_state['store_restored'] = False
+    if st.session_state.get('store_restored'):
+        return
+    st.session_state['store_restored'] = True
+    for name in STORED:
+        if name in st.session_state:
+            continue
+        version = current_version(name)
+        if version is None:
+            continue
+        try:
+            put_shared(name, stored_key(name, version), lambda: load_version(name, version))
+        except Exception:
+            # Unreadable version, the data has to be uploaded again
+            continue
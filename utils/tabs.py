@@ -0,0 +1,9 @@
+import streamlit as st
+
+# --- LAZY TABS ---
+
+def lazy_tabs(labels, key):
+    # Replacement of st.tabs that only runs the body of the tab the user is looking at: st.tabs sends every tab's
+    # content on every rerun, here the page checks the returned label instead (`if tab == labels[i]:`).
+    # The selection is a widget, so it survives reruns.
+    return st.radio('Nézet', labels, horizontal=True, key=key, label_visibility='collapsed')